@@ -1,31 +1,142 @@
 from hashlib import sha256
 
+import merkle
+
 class Block:
     """
     Represents a single block in the blockchain.
     Each block contains an index, a list of transactions, the previous block's hash, and a nonce.
+
+    The `version` field selects the hashing scheme:
+      1 - legacy: sha256(index + nonce + prev_hash + transactions)
+      2 - midstate: sha256("v2" + index + prev_hash + transactions + nonce), where
+          everything before the nonce is hashed once and the state is copied per nonce
+      3 - header: sha256("v3" + index + prev_hash + merkle_root + nonce), a fixed-size
+          header that commits to the transactions through their Merkle root
+    Blocks received without a version are treated as version 1 so old chains still validate.
     """
 
-    def __init__(self, index, transactions, prev_hash):
+    LEGACY_VERSION = 1
+    MIDSTATE_VERSION = 2
+    MERKLE_VERSION = 3
+    VERSION = MERKLE_VERSION
+
+    def __init__(self, index, transactions, prev_hash, version=VERSION, merkle_root=None):
         self.index = index
         self.transactions = transactions  # List of transactions (file information)
         self.prev_hash = prev_hash        # Hash of the previous block
         self.nonce = 0                    # Nonce for Proof-of-Work
+        self.version = version            # Hashing scheme, see class docstring
+        if version >= Block.MERKLE_VERSION:
+            # Root claimed by the block; check it with verify_transactions()
+            self.merkle_root = merkle_root or merkle.merkle_root(transactions)
+        self._midstate = None             # Cached hashlib state of the fixed fields
+
+    def _header_prefix(self):
+        if self.version >= Block.MERKLE_VERSION:
+            committed = self.merkle_root
+        else:
+            committed = str(self.transactions)
+        return f"v{self.version}" + str(self.index) + self.prev_hash + committed
 
     def generate_hash(self):
         """
         Generates a SHA-256 hash of the block's contents.
         """
-        block_contents = (
-            str(self.index) +
-            str(self.nonce) +
-            self.prev_hash +
-            str(self.transactions)
+        if self.version == Block.LEGACY_VERSION:
+            block_contents = (
+                str(self.index) +
+                str(self.nonce) +
+                self.prev_hash +
+                str(self.transactions)
+            )
+            return sha256(block_contents.encode()).hexdigest()
+
+        if self._midstate is None:
+            self._midstate = sha256(self._header_prefix().encode())
+        state = self._midstate.copy()
+        state.update(str(self.nonce).encode())
+        return state.hexdigest()
+
+    def verify_transactions(self):
+        """
+        Checks that the transactions match the Merkle root in the header.
+        Blocks before version 3 hash their transactions directly and always pass.
+        """
+        if self.version < Block.MERKLE_VERSION:
+            return True
+        return merkle.merkle_root(self.transactions) == self.merkle_root
+
+    def transaction_proof(self, position):
+        """
+        Returns the Merkle inclusion proof for the transaction at `position`.
+        """
+        return merkle.merkle_proof(self.transactions, position)
+
+    @staticmethod
+    def verify_transaction(block_data, transaction, proof, difficulty):
+        """
+        Checks one transaction against a serialized block without touching the
+        other transactions: the header must hash to the block's hash, that hash
+        must meet the Proof-of-Work `difficulty` (Blockchain.DIFFICULTY), and the
+        proof must lead from the transaction to the header's Merkle root.
+        """
+        if block_data.get("version", Block.LEGACY_VERSION) < Block.MERKLE_VERSION:
+            return False
+        header = Block(
+            block_data["index"],
+            [],
+            block_data["prev_hash"],
+            block_data["version"],
+            block_data["merkle_root"]
+        )
+        header.nonce = block_data["nonce"]
+        return (
+            block_data["hash"].startswith("0" * difficulty) and
+            header.generate_hash() == block_data["hash"] and
+            merkle.verify_proof(transaction, proof, block_data["merkle_root"])
         )
-        return sha256(block_contents.encode()).hexdigest()
 
     def add_transaction(self, transaction):
         """
         Adds a transaction to the block.
         """
-        self.transactions.append(transaction)
\ No newline at end of file
+        self.transactions.append(transaction)
+        if self.version >= Block.MERKLE_VERSION:
+            self.merkle_root = merkle.merkle_root(self.transactions)
+        self._midstate = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuilds a block from its serialized fields, including nonce and hash.
+        """
+        block = cls(
+            data["index"],
+            data["transactions"],
+            data["prev_hash"],
+            data.get("version", Block.LEGACY_VERSION),
+            data.get("merkle_root")
+        )
+        block.nonce = data["nonce"]
+        if "hash" in data:
+            block.hash = data["hash"]
+        return block
+
+    def to_dict(self):
+        """
+        Returns the block's public fields for serialization.
+        """
+        return {k: v for k, v in self.__dict__.items() if not k.startswith("_")}
+
+    def to_header_dict(self):
+        """
+        Returns the serialized fields without the transactions.
+        """
+        return {k: v for k, v in self.to_dict().items() if k != "transactions"}
+
+    def __getstate__(self):
+        # hashlib objects cannot be pickled; workers rebuild the midstate themselves
+        state = self.__dict__.copy()
+        state["_midstate"] = None
+        return state
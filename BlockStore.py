@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import struct
+import threading
+from collections import OrderedDict
+
+from Block import Block
+
+# Index record: block index, segment number, offset, length, raw block hash
+INDEX_RECORD = struct.Struct(">QIQI32s")
+LENGTH_PREFIX = struct.Struct(">I")
+
+class CorruptRecord(Exception):
+    """Raised when an index record or a stored block is missing, torn or inconsistent."""
+
+class BlockStore:
+    """
+    Append-only, segment-file storage for the chain.
+
+    Blocks are written as length-prefixed JSON to blk<NNNNN>.dat segments and a
+    fixed-size record per block is appended to index.dat, so block i is found by
+    seeking to i * INDEX_RECORD.size. Writes are fsync'ed in batches of
+    FSYNC_EVERY blocks, and a background thread syncs a partial batch once it is
+    FSYNC_INTERVAL seconds old; after each sync the height and hash of the
+    durable tip go to checkpoint.json. On startup
+    only the blocks after the checkpoint are re-verified, so restart time depends
+    on the batch size rather than the chain length.
+
+    The store behaves like the list Blockchain.chain used to be (len, indexing,
+    iteration, append) and reads blocks lazily through a small LRU cache.
+    """
+
+    SEGMENT_SIZE = 64 * 1024 * 1024
+    FSYNC_EVERY = 16        # blocks per fsync batch
+    FSYNC_INTERVAL = 5.0    # seconds before a partial batch is synced
+    CACHE_SIZE = 256
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._cache = OrderedDict()
+        self._readers = {}
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._closed = threading.Event()
+
+        self._index = open(os.path.join(self.directory, "index.dat"), "a+b")
+        self._length = os.path.getsize(self._index.name) // INDEX_RECORD.size
+        self._index.truncate(self._length * INDEX_RECORD.size)
+
+        self._segment_no = self._record(self._length - 1)[0] if self._length else 0
+        self._segment = open(self._segment_path(self._segment_no), "a+b")
+        threading.Thread(target=self._sync_idle, name="block-store-sync", daemon=True).start()
+
+    # --- Paths and raw records ---
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"blk{segment:05d}.dat")
+
+    def _checkpoint_path(self):
+        return os.path.join(self.directory, "checkpoint.json")
+
+    def _record(self, i):
+        """Returns (segment, offset, length, hash) for block i."""
+        self._index.seek(i * INDEX_RECORD.size)
+        data = self._index.read(INDEX_RECORD.size)
+        if len(data) != INDEX_RECORD.size:
+            raise CorruptRecord(f"Index record {i} is truncated.")
+        index, segment, offset, length, raw_hash = INDEX_RECORD.unpack(data)
+        if index != i:
+            raise CorruptRecord("Block index file is corrupted.")
+        return segment, offset, length, raw_hash.hex()
+
+    def _reader(self, segment):
+        if segment not in self._readers:
+            self._readers[segment] = open(self._segment_path(segment), "rb")
+        return self._readers[segment]
+
+    def _read_block(self, i):
+        segment, offset, length, block_hash = self._record(i)
+        if segment == self._segment_no:
+            self._segment.flush()
+        reader = self._reader(segment)
+        reader.seek(offset + LENGTH_PREFIX.size)
+        try:
+            block = Block.from_dict(json.loads(reader.read(length).decode()))
+        except (ValueError, KeyError, TypeError) as e:
+            raise CorruptRecord(f"Block {i} is torn or unreadable: {e}") from e
+        if getattr(block, "hash", None) != block_hash:
+            raise CorruptRecord("Block segment does not match its index.")
+        return block
+
+    # --- List interface ---
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._length))]
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError("block index out of range")
+        with self._lock:
+            if i in self._cache:
+                self._cache.move_to_end(i)
+                return self._cache[i]
+            block = self._read_block(i)
+            self._cache[i] = block
+            if len(self._cache) > BlockStore.CACHE_SIZE:
+                self._cache.popitem(last=False)
+            return block
+
+    def __iter__(self):
+        # Full scans read around the cache so they do not evict hot blocks
+        for i in range(self._length):
+            with self._lock:
+                block = self._cache.get(i) or self._read_block(i)
+            yield block
+
+    def append(self, block):
+        """Appends a block (which must already carry its hash) to the store."""
+        data = json.dumps(block.to_dict()).encode()
+        with self._lock:
+            if self._segment.tell() and self._segment.tell() + len(data) > BlockStore.SEGMENT_SIZE:
+                self._sync()
+                self._segment.close()
+                self._segment_no += 1
+                self._segment = open(self._segment_path(self._segment_no), "a+b")
+            self._segment.seek(0, os.SEEK_END)
+            offset = self._segment.tell()
+            self._segment.write(LENGTH_PREFIX.pack(len(data)) + data)
+            self._index.seek(0, os.SEEK_END)
+            self._index.write(INDEX_RECORD.pack(
+                self._length, self._segment_no, offset, len(data), bytes.fromhex(block.hash)
+            ))
+            self._segment.flush()
+            self._index.flush()
+            self._length += 1
+            self._unsynced += 1
+            if (self._unsynced >= BlockStore.FSYNC_EVERY or
+                    time.monotonic() - self._last_sync >= BlockStore.FSYNC_INTERVAL):
+                self._sync()
+
+    # --- Durability ---
+
+    def _sync(self):
+        if not self._length:
+            return
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+        self._index.flush()
+        os.fsync(self._index.fileno())
+        checkpoint = {"height": self._length, "hash": self._record(self._length - 1)[3]}
+        tmp_path = self._checkpoint_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._checkpoint_path())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def _sync_idle(self):
+        """Background loop: syncs a partial batch left FSYNC_INTERVAL seconds by an idle writer."""
+        while not self._closed.wait(BlockStore.FSYNC_INTERVAL):
+            with self._lock:
+                if (not self._closed.is_set() and self._unsynced and
+                        time.monotonic() - self._last_sync >= BlockStore.FSYNC_INTERVAL):
+                    self._sync()
+
+    def _read_checkpoint(self):
+        try:
+            with open(self._checkpoint_path()) as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        height = checkpoint.get("height", 0)
+        if not 0 < height <= self._length or self._record(height - 1)[3] != checkpoint.get("hash"):
+            return 0
+        return height
+
+    def _truncate(self, length):
+        """Drops blocks from `length` onwards, e.g. a torn write after a crash."""
+        if length < self._length:
+            segment, offset, _, _ = self._record(length)
+            for reader in self._readers.values():
+                reader.close()
+            self._readers = {}
+            self._segment.close()
+            for later in range(segment + 1, self._segment_no + 1):
+                if os.path.exists(self._segment_path(later)):
+                    os.remove(self._segment_path(later))
+            self._segment_no = segment
+            self._segment = open(self._segment_path(segment), "a+b")
+            self._segment.truncate(offset)
+        self._index.truncate(length * INDEX_RECORD.size)
+        self._length = length
+        self._cache = OrderedDict((k, v) for k, v in self._cache.items() if k < length)
+
+    def recover(self, is_valid):
+        """
+        Verifies the blocks written after the last checkpoint and truncates the
+        store at the first one that is missing, torn or invalid. `is_valid(block,
+        hash)` is the chain's Proof-of-Work check. Returns the verified height.
+        """
+        with self._lock:
+            height = self._read_checkpoint()
+            prev_hash = self._record(height - 1)[3] if height else "0"
+            for i in range(height, self._length):
+                try:
+                    block = self._read_block(i)
+                except CorruptRecord:
+                    self._truncate(i)
+                    break
+                # The genesis block is not mined, so it is only checked structurally
+                valid_pow = i == 0 or is_valid(block, block.hash)
+                if not (valid_pow and block.generate_hash() == block.hash and
+                        block.prev_hash == prev_hash and block.verify_transactions()):
+                    self._truncate(i)
+                    break
+                prev_hash = block.hash
+            self._sync()
+            return self._length
+
+    def close(self):
+        with self._lock:
+            if self._closed.is_set():
+                return
+            self._closed.set()
+            self._sync()
+            self._segment.close()
+            self._index.close()
+            for reader in self._readers.values():
+                reader.close()
@@ -1,33 +1,81 @@
+import os
+import time
 import random
+import threading
+from hashlib import sha256
 from Block import Block
+from ParallelMiner import ParallelMiner
+import merkle
 
 class Blockchain:
     DIFFICULTY = 3
+    # Worker processes used for mining; 1 keeps the single-core search, which is
+    # faster at this difficulty than starting worker processes for every block
+    MINING_WORKERS = int(os.getenv("MINING_WORKERS", 1))
 
-    def __init__(self):
+    def __init__(self, store=None):
+        """
+        Keeps the chain in memory, or in `store` (a BlockStore) when given.
+        A non-empty store is only re-verified from its last checkpoint.
+        """
         self.pending = []
-        self.chain = []
+        self.pending_bytes = 0      # Serialized size of the pending transactions
+        self._arrivals = []         # Arrival time of each pending transaction
+        self.confirmed = {}         # Transaction id -> index of the block holding it
+        self._confirmed_height = 0  # Blocks of the chain already indexed in `confirmed`
+        self._confirmed_lock = threading.Lock()
+        self._pending_ids = set()
+        self._pending_lock = threading.Lock()
+        self._mine_lock = threading.Lock()
+        # Held from the parent check to the append, so mine() and a peer's
+        # /add_block cannot both append a child of the same block
+        self._chain_lock = threading.Lock()
+        self.chain = store if store is not None else []
+        if store is not None and store.recover(Blockchain.is_valid):
+            return
         genesis_block = Block(0, [], "0")
         genesis_block.hash = genesis_block.generate_hash()
         self.chain.append(genesis_block)
 
     def add_block(self, block, block_hash):
-        if self.last_block().hash == block.prev_hash and self.is_valid(block, block_hash):
+        if not (self.is_valid(block, block_hash) and block.verify_transactions()):
+            return False
+        with self._chain_lock:
+            last_block = self.last_block()
+            if last_block.hash != block.prev_hash or block.index != last_block.index + 1:
+                return False
             block.hash = block_hash
             self.chain.append(block)
             return True
-        return False
 
-    def mine(self):
-        if not self.pending:
-            return False
+    def mine(self, max_transactions=None):
+        """
+        Seals up to `max_transactions` pending transactions (all of them by
+        default) into a new block. Transactions that arrive while the block is
+        being mined stay pending for the next one.
+        """
+        with self._mine_lock:
+            batch = self.take_pending(max_transactions)
+            if not batch:
+                return False
 
-        last_block = self.last_block()
-        new_block = Block(last_block.index + 1, self.pending, last_block.hash)
-        block_hash = self.proof_of_work(new_block)
-        self.add_block(new_block, block_hash)
-        self.pending = []
-        return new_block.index
+            last_block = self.last_block()
+            new_block = Block(last_block.index + 1, batch, last_block.hash)
+            try:
+                if Blockchain.MINING_WORKERS > 1:
+                    block_hash = self.proof_of_work_parallel(new_block)
+                else:
+                    block_hash = self.proof_of_work(new_block)
+                added = self.add_block(new_block, block_hash)
+            except Exception:
+                self.restore_pending(batch)
+                raise
+            if not added:
+                self.restore_pending(batch)
+                return False
+            with self._pending_lock:
+                self._pending_ids.difference_update(self.transaction_id(t) for t in batch)
+            return new_block.index
 
     def proof_of_work(self, block):
         block.nonce = 0
@@ -45,13 +93,70 @@ class Blockchain:
             block_hash = block.generate_hash()
         return block_hash
 
+    def proof_of_work_parallel(self, block, workers=None):
+        miner = ParallelMiner(workers or Blockchain.MINING_WORKERS)
+        return miner.mine(block, Blockchain.DIFFICULTY)
+
+    @staticmethod
+    def transaction_id(transaction):
+        return sha256(merkle.serialize_transaction(transaction)).hexdigest()
+
     def add_pending(self, transaction):
-        self.pending.append(transaction)
+        """Queues a transaction and returns its id."""
+        tx_id = self.transaction_id(transaction)
+        with self._pending_lock:
+            self.pending.append(transaction)
+            self._arrivals.append(time.monotonic())
+            self.pending_bytes += len(merkle.serialize_transaction(transaction))
+            self._pending_ids.add(tx_id)
+        return tx_id
+
+    def take_pending(self, max_transactions=None):
+        """Removes and returns the oldest pending transactions."""
+        with self._pending_lock:
+            batch = self.pending[:max_transactions]
+            self.pending = self.pending[len(batch):]
+            self._arrivals = self._arrivals[len(batch):]
+            self.pending_bytes -= sum(len(merkle.serialize_transaction(t)) for t in batch)
+            return batch
+
+    def restore_pending(self, batch):
+        """Puts a batch that could not be added back at the front of the queue."""
+        with self._pending_lock:
+            self.pending = batch + self.pending
+            self._arrivals = [time.monotonic()] * len(batch) + self._arrivals
+            self.pending_bytes += sum(len(merkle.serialize_transaction(t)) for t in batch)
+
+    def pending_since(self):
+        """Arrival time of the oldest pending transaction, or None."""
+        with self._pending_lock:
+            return self._arrivals[0] if self._arrivals else None
+
+    def _index_confirmed(self):
+        """
+        Adds the transactions of blocks not yet in `confirmed` to it. The first
+        call after a restart indexes the chain recovered from the store; later
+        calls only the blocks mined since.
+        """
+        with self._confirmed_lock:
+            for i in range(self._confirmed_height, len(self.chain)):
+                for transaction in self.chain[i].transactions:
+                    self.confirmed[self.transaction_id(transaction)] = i
+                self._confirmed_height = i + 1
+
+    def transaction_status(self, tx_id):
+        self._index_confirmed()
+        if tx_id in self.confirmed:
+            return {"status": "confirmed", "block": self.confirmed[tx_id]}
+        if tx_id in self._pending_ids:
+            return {"status": "pending"}
+        return None
 
     def check_chain_validity(self, chain):
         prev_hash = "0"
         for block in chain:
-            if not (self.is_valid(block, block.hash) and prev_hash == block.prev_hash):
+            if not (self.is_valid(block, block.hash) and prev_hash == block.prev_hash
+                    and block.verify_transactions()):
                 return False
             prev_hash = block.hash
         return True
@@ -0,0 +1,79 @@
+# file to compare the peak memory of the streamed /chain endpoint against building the whole JSON document at once
+# a chain of large blocks is written to a temporary BlockStore, then each step runs in its own process
+# so that the peak RSS reported by the OS belongs to that mode alone
+
+import os
+import sys
+import json
+import random
+import string
+import resource
+import subprocess
+import tempfile
+
+BLOCKS = 40
+PAYLOAD_SIZE = 4 * 1024 * 1024
+
+def random_payload(length):
+    """Generate a random base64-like string of given length."""
+    chunk = ''.join(random.choice(string.ascii_letters) for _ in range(4096))
+    return (chunk * (length // len(chunk) + 1))[:length]
+
+def build_chain(directory):
+    """Write BLOCKS blocks with a PAYLOAD_SIZE inline payload each."""
+    from Blockchain import Blockchain
+    from BlockStore import BlockStore
+    Blockchain.DIFFICULTY = 1
+    Blockchain.MINING_WORKERS = 1
+    blockchain = Blockchain(BlockStore(directory))
+    for i in range(BLOCKS):
+        blockchain.add_pending({
+            "user": "bench",
+            "v_file": f"file_{i}.csv",
+            "file_data": random_payload(PAYLOAD_SIZE),
+            "file_size": PAYLOAD_SIZE
+        })
+        blockchain.mine()
+    blockchain.chain.close()
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_mode(mode):
+    """Fetch the chain once in the given mode and print the peak RSS."""
+    import peer
+    peer.start_node()
+    client = peer.app.test_client()
+    received = 0
+    if mode == "buffered":
+        # Same work the endpoint did before streaming: one json.dumps of the whole chain
+        chain = [block.to_dict() for block in peer.blockchain.chain]
+        received = len(json.dumps({"length": len(chain), "chain": chain}))
+    elif mode in ("json", "ndjson"):
+        resp = client.get("/chain", query_string={"format": mode})
+        for chunk in resp.response:
+            received += len(chunk)
+    print(f"{peak_rss_mb():.1f} {received}")
+
+def run_stream_benchmark():
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, CHAIN_DATA_DIR=directory)
+        # Children inherit the parent's peak RSS, so the parent must stay small
+        subprocess.run([sys.executable, __file__, "build"], env=env, check=True)
+        print(f"------------Peak RSS for {BLOCKS} blocks of {PAYLOAD_SIZE // (1024 * 1024)} MB ------------")
+        for mode in ("baseline", "buffered", "json", "ndjson"):
+            out = subprocess.run(
+                [sys.executable, __file__, mode], env=env, capture_output=True, text=True, check=True
+            ).stdout.split()
+            rss, received = out[-2], out[-1]
+            print(f"{mode:<9} Peak RSS : {rss} MB  Bytes : {received}")
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2 and sys.argv[1] == "build":
+        build_chain(os.environ["CHAIN_DATA_DIR"])
+    elif len(sys.argv) == 2:
+        run_mode(sys.argv[1])
+    else:
+        run_stream_benchmark()
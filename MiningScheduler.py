@@ -0,0 +1,59 @@
+import os
+import time
+import logging
+import threading
+
+class MiningScheduler:
+    """
+    Seals pending transactions into blocks on a background thread.
+
+    A block is mined as soon as the pending queue holds `max_transactions`
+    transactions, holds `max_bytes` of serialized transactions, or its oldest
+    transaction has waited `max_wait_ms` milliseconds, whichever comes first.
+    Uploads therefore only queue a transaction, and one Proof-of-Work covers a
+    whole batch instead of a single file.
+    """
+
+    def __init__(self, blockchain, max_transactions=None, max_bytes=None, max_wait_ms=None):
+        self.blockchain = blockchain
+        self.max_transactions = max_transactions or int(os.getenv("MINE_BATCH_SIZE", 32))
+        self.max_bytes = max_bytes or int(os.getenv("MINE_BATCH_BYTES", 1024 * 1024))
+        self.max_wait = (max_wait_ms or int(os.getenv("MINE_BATCH_WAIT_MS", 2000))) / 1000
+        self._wakeup = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="mining-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def notify(self):
+        """Called after a transaction is queued so size limits are checked right away."""
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def _time_left(self):
+        """Seconds until the next block should be sealed (0 = now, None = nothing pending)."""
+        if (len(self.blockchain.pending) >= self.max_transactions or
+                self.blockchain.pending_bytes >= self.max_bytes):
+            return 0
+        since = self.blockchain.pending_since()
+        if since is None:
+            return None
+        return max(since + self.max_wait - time.monotonic(), 0)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                wait = self._time_left()
+                while wait != 0:
+                    self._wakeup.wait(wait)
+                    wait = self._time_left()
+            try:
+                self.blockchain.mine(self.max_transactions)
+            except Exception:
+                # The batch is back in the pending queue; retry after a pause
+                # instead of losing the thread and never mining again
+                logging.exception("Mining failed, retrying")
+                time.sleep(self.max_wait)
@@ -0,0 +1,72 @@
+# file to measure how the parallel Proof of Work engine scales with the number of worker processes
+# each run hashes a fixed block against an unreachable target for a fixed time and reports hashes per second
+# a second table reports the time taken to actually mine a block at a real difficulty
+# hash rates are measured from the moment the first worker starts hashing; the time spent starting the
+# worker processes is reported separately, since it is paid again for every mined block
+
+import os
+import random
+import string
+from timeit import default_timer as timer
+
+from Block import Block
+from Blockchain import Blockchain
+from ParallelMiner import ParallelMiner
+
+RUN_SECONDS = 3
+MINE_DIFFICULTY = 5
+
+def random_char(length):
+    """Generate a random string of given length."""
+    return ''.join(random.choice(string.ascii_letters) for _ in range(length))
+
+def make_block():
+    """Build a block with a few random file transactions."""
+    transactions = [
+        {
+            "user": random_char(10),
+            "v_file": random_char(10) + ".csv",
+            "file_data": random_char(2000),
+            "file_size": 2000
+        }
+        for _ in range(5)
+    ]
+    return Block(random.randint(1, 2000), transactions, "0" * 64)
+
+def worker_counts():
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    return counts
+
+def run_parallel_benchmark():
+    block = make_block()
+
+    print("------------Hash Rate by Worker Count ------------")
+    base_rate = None
+    for workers in worker_counts():
+        miner = ParallelMiner(workers)
+        _, _, attempts = miner.search(block, 64, timeout=RUN_SECONDS)
+        rate = attempts / miner.hashing_time
+        base_rate = base_rate or rate
+        print(f"Workers {workers} : {round(rate)} H/s ({round(rate / base_rate, 2)}x)"
+              f"  Startup : {round(miner.startup_time, 3)} s")
+
+    print(f"------------Time to Mine at Difficulty {MINE_DIFFICULTY} ------------")
+    for workers in worker_counts():
+        miner = ParallelMiner(workers)
+        start = timer()
+        nonce, block_hash, _ = miner.search(block, MINE_DIFFICULTY)
+        end = timer()
+        block.nonce = nonce
+        Blockchain.DIFFICULTY = MINE_DIFFICULTY
+        assert Blockchain.is_valid(block, block_hash)
+        print(f"Workers {workers} Time : {round(end - start, 5)}  Hashing : {round(miner.hashing_time, 5)}"
+              f"  Startup : {round(miner.startup_time, 5)}")
+
+    start = timer()
+    Blockchain().proof_of_work(block)
+    print(f"Single-core (MINING_WORKERS=1) Time : {round(timer() - start, 5)}")
+
+if __name__ == "__main__":
+    run_parallel_benchmark()
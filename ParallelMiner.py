@@ -0,0 +1,119 @@
+import os
+import multiprocessing
+import queue
+import time
+
+# Number of nonces a worker tries between checks of the shared stop flag
+CHECK_INTERVAL = 2048
+# Seconds between checks that the workers are still alive while waiting for results
+LIVENESS_INTERVAL = 1.0
+
+
+def _search_nonces(block, difficulty, start, step, found, results):
+    """
+    Worker loop: tries nonces start, start + step, start + 2 * step, ...
+    until a valid hash is found or another worker sets `found`.
+    Always reports (nonce, hash, attempts, started) back on `results`, where
+    `started` is the time.monotonic() at which this worker began hashing.
+    """
+    started = time.monotonic()
+    target = "0" * difficulty
+    nonce = start
+    attempts = 0
+    while not found.is_set():
+        for _ in range(CHECK_INTERVAL):
+            block.nonce = nonce
+            block_hash = block.generate_hash()
+            attempts += 1
+            if block_hash.startswith(target):
+                found.set()
+                results.put((nonce, block_hash, attempts, started))
+                return
+            nonce += step
+    results.put((None, None, attempts, started))
+
+
+class ParallelMiner:
+    """
+    Proof-of-Work engine that splits the nonce space across worker processes.
+    Worker i tries nonces i, i + workers, i + 2 * workers, ... and every worker
+    stops as soon as one of them finds a hash with the required difficulty.
+
+    Workers are started with the spawn context, since the node forks from a
+    threaded server, so each search pays for interpreter startup. That only
+    pays off when a block takes well over that to mine (high difficulty).
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        # Timing of the last search(): seconds from launch until the first worker
+        # began hashing, and seconds from then until the search ended
+        self.startup_time = None
+        self.hashing_time = None
+
+    def search(self, block, difficulty, timeout=None):
+        """
+        Runs the workers against `block` and returns (nonce, hash, attempts).
+        `attempts` is the total number of hashes computed by all workers.
+        If `timeout` seconds pass without a valid hash, nonce and hash are None.
+        Raises RuntimeError if a worker dies before reporting.
+        """
+        ctx = multiprocessing.get_context("spawn")
+        found = ctx.Event()
+        results = ctx.Queue()
+        procs = [
+            ctx.Process(
+                target=_search_nonces,
+                args=(block, difficulty, i, self.workers, found, results),
+                daemon=True
+            )
+            for i in range(self.workers)
+        ]
+        launched = time.monotonic()
+        for proc in procs:
+            proc.start()
+
+        first_started = None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        nonce, block_hash, attempts = None, None, 0
+        reported = 0
+        while reported < self.workers:
+            wait = LIVENESS_INTERVAL
+            if deadline is not None and not found.is_set():
+                wait = min(max(deadline - time.monotonic(), 0), wait)
+            try:
+                w_nonce, w_hash, w_attempts, w_started = results.get(timeout=wait)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    found.set()
+                # Workers put their result before exiting, so a dead worker
+                # with nothing left in the queue will never report
+                dead = [proc for proc in procs if proc.exitcode not in (None, 0)]
+                if dead or (all(proc.exitcode is not None for proc in procs) and results.empty()):
+                    found.set()
+                    for proc in procs:
+                        proc.terminate()
+                        proc.join()
+                    raise RuntimeError(f"Mining worker exited with code {dead[0].exitcode if dead else 0}")
+                continue
+            reported += 1
+            attempts += w_attempts
+            first_started = w_started if first_started is None else min(first_started, w_started)
+            if w_hash is not None and block_hash is None:
+                nonce, block_hash = w_nonce, w_hash
+
+        ended = time.monotonic()
+        for proc in procs:
+            proc.join()
+        self.startup_time = first_started - launched
+        self.hashing_time = ended - first_started
+        return nonce, block_hash, attempts
+
+    def mine(self, block, difficulty):
+        """
+        Finds a valid nonce for `block`, stores it on the block and returns the
+        hash, matching the contract of Blockchain.proof_of_work.
+        """
+        nonce, block_hash, _ = self.search(block, difficulty)
+        block.nonce = nonce
+        return block_hash
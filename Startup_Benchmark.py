@@ -0,0 +1,59 @@
+# file to measure how long each process role takes to import its code and how much memory that costs
+# every role is imported in a fresh interpreter, so the reported peak RSS belongs to that role alone
+# the web app and job workers should stay small; only preloaded generation workers load torch up front
+
+import os
+import sys
+import resource
+import statistics
+import subprocess
+import tempfile
+from timeit import default_timer as timer
+
+RUNS = 3
+
+ROLES = {
+    "interpreter": "pass",
+    "node": "import peer",
+    "web": "import app",
+    "job worker": "import app.jobs",
+    "job worker (preloaded)": "import app.jobs; from app import gan; gan.preload()",
+    "figure worker": "import app.gan; app.gan.pyplot()",
+}
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_role(role):
+    """Import what the role imports and print the elapsed time and peak RSS."""
+    start = timer()
+    exec(ROLES[role])
+    print(f"{timer() - start:.3f} {peak_rss_mb():.1f}")
+
+def run_startup_benchmark():
+    with tempfile.TemporaryDirectory() as directory:
+        # Keep the stores created at import time out of the working tree
+        env = dict(
+            os.environ,
+            CHAIN_DATA_DIR=os.path.join(directory, "chaindata"),
+            BLOB_STORE_DIR=os.path.join(directory, "blobstore"),
+            JOB_DB_PATH=os.path.join(directory, "jobs.db"),
+        )
+        print(f"------------Import time and peak RSS per process role (median of {RUNS}) ------------")
+        for role in ROLES:
+            times, peaks = [], []
+            for _ in range(RUNS):
+                out = subprocess.run(
+                    [sys.executable, __file__, role], env=env, capture_output=True, text=True, check=True
+                ).stdout.split()
+                times.append(float(out[-2]))
+                peaks.append(float(out[-1]))
+            print(f"{role:<24} Import : {statistics.median(times):.3f} s  Peak RSS : {statistics.median(peaks):.1f} MB")
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2:
+        run_role(sys.argv[1])
+    else:
+        run_startup_benchmark()
@@ -33,5 +33,6 @@ db = mongo_client.file_storage
 users = db.users
 model_mappings = db.model_mappings
 public_files = db.public_files
+uploads = db.uploads            # Encrypted upload of each user's file -> its blob digest
 
 from app import views
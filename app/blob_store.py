@@ -0,0 +1,124 @@
+import os
+import hashlib
+import tempfile
+
+class BlobIntegrityError(Exception):
+    """Raised when a stored blob no longer matches its SHA-256 digest."""
+
+class BlobReader:
+    """
+    File-like wrapper that hashes a blob while it is read and checks the digest
+    once the end of the blob is reached, so integrity is verified lazily.
+    """
+
+    def __init__(self, path, digest):
+        self._file = open(path, 'rb')
+        self._hasher = hashlib.sha256()
+        self._digest = digest
+        self._checked = False
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._hasher.update(data)
+        if not self._checked and (size is None or size < 0 or not data):
+            self._check()
+        return data
+
+    def readinto(self, buf):
+        n = self._file.readinto(buf)
+        self._hasher.update(memoryview(buf)[:n])
+        if not n and not self._checked:
+            self._check()
+        return n
+
+    def _check(self):
+        self._checked = True
+        if self._hasher.hexdigest() != self._digest:
+            raise BlobIntegrityError(f"Blob {self._digest} is corrupted.")
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class BlobWriter:
+    """
+    Writable file-like blob: data is hashed as it is written to a temp file in
+    the store and moved to its content address by commit(). Used as a context
+    manager it commits on success and discards the temp file on error.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.root, suffix=".tmp")
+        self._file = os.fdopen(fd, 'wb')
+        self._hasher = hashlib.sha256()
+        self.size = 0
+        self.digest = None
+
+    def write(self, data):
+        self._hasher.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def commit(self):
+        """Move the blob into place. Returns (digest, size)."""
+        self._file.close()
+        self.digest = self._hasher.hexdigest()
+        target = self._store.path(self.digest)
+        if os.path.exists(target):
+            os.remove(self._tmp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(self._tmp_path, target)
+        return self.digest, self.size
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+class BlobStore:
+    """
+    Content-addressed file store keyed by SHA-256.
+    Blobs live at <root>/<digest[:2]>/<digest[2:4]>/<digest> and are written
+    through a temp file in the same shard, then renamed into place.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        return os.path.isfile(self.path(digest))
+
+    def create(self):
+        """A BlobWriter for content produced by a writer, e.g. an encryptor."""
+        return BlobWriter(self)
+
+    def open(self, digest, verify=True):
+        """
+        Open a blob for reading; its digest is checked when reading reaches the end.
+        With verify=False a plain seekable file is returned instead, for callers
+        that authenticate the contents themselves.
+        """
+        path = self.path(digest)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Blob {digest} not found.")
+        return BlobReader(path, digest) if verify else open(path, 'rb')
@@ -0,0 +1,208 @@
+import time
+import threading
+from types import MappingProxyType
+
+import requests
+
+# Headers fetched per request while looking for a common ancestor
+HEADER_PAGE = 100
+# Seconds before a call to the node is abandoned, and the minimum seconds
+# between two syncs (requests in between are served the current snapshot)
+REQUEST_TIMEOUT = 5
+MIN_SYNC_INTERVAL = 1.0
+
+def _freeze(transaction, block):
+    entry = {k: v for k, v in transaction.items() if k != "file_data"}
+    entry["index"] = block["index"]
+    entry["hash"] = block["prev_hash"]
+    return MappingProxyType(entry)
+
+def _prefix(entries, height):
+    """The leading entries (in chain order) that lie below `height`."""
+    n = len(entries)
+    while n and entries[n - 1]["index"] >= height:
+        n -= 1
+    return entries[:n]
+
+class _ChainLog:
+    """
+    Append-only entry lists shared by the snapshots of one chain branch. Each
+    snapshot sees the prefix below its own height, so appending for a newer
+    snapshot never changes what an older one returns.
+    """
+
+    def __init__(self):
+        self.height = 0
+        self.entries = []
+        self.by_file = {}
+        self.by_owner = {}
+        self.by_block = {}
+
+    def append(self, block):
+        added = tuple(_freeze(t, block) for t in block["transactions"] if "v_file" in t)
+        for entry in added:
+            self.by_file.setdefault(entry["v_file"], []).append(entry)
+            self.by_owner.setdefault(entry.get("owner"), []).append(entry)
+        self.entries.extend(added)
+        self.by_block[block["index"]] = added
+        self.height = block["index"] + 1
+
+    def copy(self, height):
+        """A new log holding the blocks below `height`."""
+        log = _ChainLog()
+        for entry in self.entries:
+            if entry["index"] >= height:
+                break
+            log.by_file.setdefault(entry["v_file"], []).append(entry)
+            log.by_owner.setdefault(entry.get("owner"), []).append(entry)
+            log.entries.append(entry)
+        log.by_block = {i: v for i, v in self.by_block.items() if i < height}
+        log.height = height
+        return log
+
+class ChainSnapshot:
+    """
+    Immutable view of the file transactions up to a given chain height, keyed
+    by filename, owner and block index. Updates build a new snapshot, so a
+    snapshot can be shared between request threads without locking.
+    Inline payloads (`file_data`) are left out to keep snapshots small.
+
+    Snapshots of the same branch share one _ChainLog and each reads only the
+    part below its height, so extending the latest snapshot costs only the new
+    blocks. Only a reorg (truncated) or extending an older snapshot copies the
+    log. Snapshots are built by one thread at a time (ChainIndex.sync).
+    """
+
+    def __init__(self, height=0, tip_hash="0", log=None, count=0):
+        self.height = height        # Number of blocks covered
+        self.tip_hash = tip_hash    # Hash of block height - 1 ("0" when empty)
+        self._log = log if log is not None else _ChainLog()
+        self._count = count         # Entries of the log below height
+
+    @property
+    def entries(self):
+        """All file entries in chain order."""
+        return tuple(self._log.entries[:self._count])
+
+    def extend(self, blocks):
+        """Returns a new snapshot with `blocks` (consecutive, starting at height) added."""
+        if not blocks:
+            return self
+        log = self._log if self._log.height == self.height else self._log.copy(self.height)
+        for block in blocks:
+            log.append(block)
+        return ChainSnapshot(log.height, blocks[-1]["hash"], log, len(log.entries))
+
+    def truncated(self, height, tip_hash):
+        """Returns a new snapshot without the blocks at `height` and above."""
+        log = self._log.copy(height)
+        return ChainSnapshot(height, tip_hash, log, len(log.entries))
+
+    def find_file(self, filename):
+        """Entries for `filename`, oldest first."""
+        return tuple(_prefix(self._log.by_file.get(filename, ()), self.height))
+
+    def block_files(self, block_index):
+        """Entries stored in the block at `block_index`."""
+        return self._log.by_block.get(block_index, ()) if block_index < self.height else ()
+
+    def files_for(self, username, is_master=False):
+        """Files visible to a user: their own and anonymous uploads, newest first."""
+        if is_master:
+            visible = self._log.entries[:self._count]
+        else:
+            visible = _prefix(self._log.by_owner.get(username, []), self.height)
+            if username != "anonymous":
+                visible += _prefix(self._log.by_owner.get("anonymous", []), self.height)
+            visible.sort(key=lambda entry: entry["index"])
+        visible.reverse()
+        return visible
+
+class ChainIndex:
+    """
+    Follows the node's chain and publishes ChainSnapshot objects.
+
+    sync() remembers the height and hashes it has seen and only fetches newer
+    blocks. If the node's block at our tip has a different hash (a reorg), it
+    walks back through /headers to the last common block, drops everything
+    above it and re-fetches from there.
+
+    Only one request thread syncs at a time, at most every MIN_SYNC_INTERVAL
+    seconds; the others get the current snapshot instead of waiting on the node.
+    """
+
+    def __init__(self, node_addr):
+        self.node_addr = node_addr
+        self._hashes = []                   # Block hash at each indexed height
+        self._snapshot = ChainSnapshot()
+        self._sync_lock = threading.Lock()  # One poll of the node at a time
+        self._last_sync = None
+
+    def snapshot(self):
+        """The latest published snapshot."""
+        return self._snapshot
+
+    def _get(self, path, **params):
+        resp = requests.get(f"{self.node_addr}{path}", params=params, timeout=REQUEST_TIMEOUT)
+        return resp.json() if resp.status_code == 200 else None
+
+    def _common_ancestor(self):
+        """Height of the longest prefix we share with the node."""
+        height = len(self._hashes)
+        if not height:
+            return 0
+        tip = self._get(f"/blocks/{height - 1}", headers_only=1)
+        if tip and tip["hash"] == self._hashes[-1]:
+            return height
+        while height > 0:
+            start = max(0, height - HEADER_PAGE)
+            page = self._get("/headers", **{"from": start, "limit": height - start})
+            if page is None:
+                return height
+            for header in reversed(page["blocks"]):
+                if self._hashes[header["index"]] == header["hash"]:
+                    return header["index"] + 1
+            height = start
+        return 0
+
+    def sync(self):
+        """
+        Fetch blocks the node has added since the last sync and publish a new
+        snapshot. Returns the current snapshot without contacting the node if
+        another thread is syncing or the last sync was under MIN_SYNC_INTERVAL ago.
+        """
+        if not self._sync_lock.acquire(blocking=False):
+            return self._snapshot
+        try:
+            if self._last_sync is not None and time.monotonic() - self._last_sync < MIN_SYNC_INTERVAL:
+                return self._snapshot
+            self._last_sync = time.monotonic()
+            return self._sync()
+        finally:
+            self._sync_lock.release()
+
+    def _sync(self):
+        """Fetch and index the blocks after the common ancestor; the caller holds _sync_lock."""
+        snapshot = self._snapshot
+        ancestor = self._common_ancestor()
+        if ancestor < snapshot.height:
+            del self._hashes[ancestor:]
+            snapshot = snapshot.truncated(ancestor, self._hashes[-1] if self._hashes else "0")
+        start = snapshot.height
+        while start is not None:
+            page = self._get("/blocks", **{"from": start})
+            if page is None:
+                break
+            blocks = []
+            for block in page["blocks"]:
+                if block["prev_hash"] != (self._hashes[-1] if self._hashes else "0"):
+                    # The chain changed while paging; the next sync rolls back
+                    page["next"] = None
+                    break
+                self._hashes.append(block["hash"])
+                blocks.append(block)
+            snapshot = snapshot.extend(blocks)
+            self._snapshot = snapshot
+            start = page["next"]
+        self._snapshot = snapshot
+        return snapshot
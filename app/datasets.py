@@ -0,0 +1,157 @@
+import os
+import time
+import logging
+import posixpath
+
+from pymongo.errors import PyMongoError
+
+from app import app, public_files, model_mappings, uploads
+
+# Indexes every deployment needs, per collection: (keys, options)
+INDEXES = {
+    "public_files": [
+        # Partial, so legacy documents that backfill cannot give an ID do not collide on null
+        ([("dataset_id", 1)], {"name": "dataset_id_unique", "unique": True,
+                               "partialFilterExpression": {"dataset_id": {"$exists": True}}}),
+        ([("uploader_username", 1), ("_id", 1)], {"name": "uploader_id"}),
+    ],
+    "model_mappings": [
+        ([("username", 1), ("filename", 1)], {"name": "username_filename_unique", "unique": True}),
+        ([("username", 1), ("data_fingerprint", 1)], {"name": "username_data_fingerprint"}),
+        ([("username", 1), ("schema_fingerprint", 1), ("updated", -1)], {"name": "username_schema_fingerprint"}),
+    ],
+    "uploads": [
+        ([("username", 1), ("filename", 1)], {"name": "username_filename_unique", "unique": True}),
+    ],
+}
+
+COLLECTIONS = {
+    "public_files": public_files,
+    "model_mappings": model_mappings,
+    "uploads": uploads,
+}
+
+def dataset_id(path):
+    """
+    Canonical ID of a synthetic dataset: its CSV path relative to the upload
+    folder, with forward slashes. Absolute paths, Windows separators and "./"
+    segments all map to the same ID.
+    """
+    path = path.replace("\\", "/")
+    if os.path.isabs(path):
+        path = os.path.relpath(path, app.config['UPLOAD_FOLDER']).replace("\\", "/")
+    return posixpath.normpath(path).lstrip("/")
+
+def upload_filter(username, filename):
+    return {"username": username, "filename": filename}
+
+def record_upload(username, filename, digest, blob_size, file_size):
+    """Point a user's file at the blob holding its latest encrypted upload."""
+    uploads.update_one(
+        upload_filter(username, filename),
+        {"$set": {"file_digest": digest, "blob_size": blob_size, "file_size": file_size,
+                  "uploaded": time.time()}},
+        upsert=True
+    )
+
+def upload_digest(username, filename):
+    """Blob digest of a user's latest upload of `filename`, or None."""
+    doc = uploads.find_one(upload_filter(username, filename), {"file_digest": 1})
+    return doc.get("file_digest") if doc else None
+
+def legacy_upload_path(filename):
+    """Where uploads were written before they went to the blob store."""
+    return os.path.join(app.config['UPLOAD_FOLDER'], f"{os.path.splitext(filename)[0]}.enc")
+
+def summary(doc):
+    """
+    The fields the public listing shows, computed from a public_files document
+    and stored on it, so listing datasets never loads their analysis_results.
+    """
+    filename = os.path.basename(doc.get("synthetic_file_path", "").replace("\\", "/"))
+    created = os.path.splitext(filename)[0].rsplit("_", 1)[-1]
+    analysis = doc.get("analysis_results") or {}
+    return {
+        "synthetic_filename": filename,
+        "model_filename": os.path.basename(doc.get("model_name", "")),
+        "created": int(created) if filename.startswith("synthetic_") and created.isdigit() else None,
+        "average_ks_stat": analysis.get("average_ks_stat"),
+        "rows": (analysis.get("preview") or {}).get("rows")
+    }
+
+def backfill():
+    """
+    Give public_files documents from before dataset IDs and summaries their
+    ID and summary. Returns the number of documents updated.
+    """
+    count = 0
+    stale = public_files.find(
+        {"$or": [{"dataset_id": {"$exists": False}}, {"summary": {"$exists": False}}]},
+        {"synthetic_file_path": 1, "model_name": 1,
+         "analysis_results.average_ks_stat": 1, "analysis_results.preview.rows": 1}
+    )
+    for doc in stale:
+        if doc.get("synthetic_file_path"):
+            public_files.update_one(
+                {"_id": doc["_id"]},
+                {"$set": {"dataset_id": dataset_id(doc["synthetic_file_path"]), "summary": summary(doc)}}
+            )
+            count += 1
+    return count
+
+def outdated(info, keys, options):
+    """Whether an existing index (from index_information) differs from its INDEXES entry."""
+    if info["key"] != keys:
+        return True
+    return any(info.get(option) != value for option, value in options.items() if option != "name")
+
+def ensure_indexes():
+    """
+    Create the indexes in INDEXES (a no-op for those that already exist) and
+    rebuild those whose definition changed. Failures, such as duplicates
+    blocking a unique index, are logged and left for missing_indexes to report.
+    """
+    backfilled = backfill()
+    if backfilled:
+        logging.info(f"Assigned dataset IDs and summaries to {backfilled} public datasets")
+    for name, indexes in INDEXES.items():
+        existing = COLLECTIONS[name].index_information()
+        for keys, options in indexes:
+            try:
+                info = existing.get(options["name"])
+                if info is not None and outdated(info, keys, options):
+                    logging.info(f"Rebuilding index {options['name']} on {name}")
+                    COLLECTIONS[name].drop_index(options["name"])
+                COLLECTIONS[name].create_index(keys, **options)
+            except PyMongoError as e:
+                logging.error(f"Could not create index {options['name']} on {name}: {str(e)}")
+
+def missing_indexes():
+    """Names of the indexes in INDEXES that are not present, as "collection.index"."""
+    missing = []
+    for name, indexes in INDEXES.items():
+        existing = COLLECTIONS[name].index_information()
+        for _, options in indexes:
+            if options["name"] not in existing:
+                missing.append(f"{name}.{options['name']}")
+    return missing
+
+def check_indexes():
+    """Startup check: create the indexes, then log any that are still missing."""
+    try:
+        ensure_indexes()
+        missing = missing_indexes()
+    except PyMongoError as e:
+        logging.error(f"Index check failed: {str(e)}")
+        return None
+    for index in missing:
+        logging.warning(f"Missing index {index}; lookups on it will scan the collection")
+    return missing
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    missing = check_indexes()
+    if missing is None:
+        print("Index check failed, see the log above.")
+    else:
+        print("Missing indexes: " + (", ".join(missing) if missing else "none"))
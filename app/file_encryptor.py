@@ -1,33 +1,388 @@
 from app import aes
+from app import key_cache
 import sys
 import os
+import struct
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from hmac import new as new_hmac, compare_digest
 
-def read_file(file_path):
-    """Read binary data from a file."""
-    with open(file_path, 'rb') as f:
-        return f.read()
+# --- Chunked container format ---
+#
+# header : MAGIC | chunk size (uint32) | master salt (16 bytes) | file salt (16 bytes)
+# chunk i: ciphertext | HMAC-SHA256(header | i (uint64) | final flag | ciphertext)
+#
+# The AES key, HMAC key and IV are expanded from the user's master key and the
+# file salt (key_cache.file_keys); the master key is PBKDF2(password, master
+# salt) and is cached, so only the first file per user and TTL pays for the KDF.
+# Version 1 files (MAGIC_V1) have a single salt fed straight into aes.get_key_iv.
+#
+# Every chunk is encrypted with AES-CTR from its own counter block
+# (iv[:8] | i (uint32) | 0 (uint32)), so chunks are independent. All chunks but
+# the last hold exactly `chunk size` bytes. The last is shorter, possibly empty,
+# and its MAC carries the final flag, so truncating the file cannot go unnoticed.
+# Frames have a fixed size, so chunk i sits at a known offset and can be read
+# and authenticated on its own (ChunkedReader, which also authenticates the
+# final chunk on opening so random access still detects truncation).
+
+MAGIC = b"AESCHNK2"
+HEADER = struct.Struct(">8sI16s16s")
+MAGIC_V1 = b"AESCHNK1"
+HEADER_V1 = struct.Struct(">8sI16s")
+CHUNK_SIZE = 64 * 1024
+
+# Parallel encryption: chunks handed to each worker process per task, the
+# upload size below which the single-process path is used, and the size of the
+# pool shared by all uploads (half the cores, at most 4, so one upload cannot
+# take every core from the web server and the job workers)
+TASK_CHUNKS = 16
+PARALLEL_MIN_SIZE = 4 * 1024 * 1024
+ENCRYPT_WORKERS = int(os.getenv('ENCRYPT_WORKERS', max(1, min(4, (os.cpu_count() or 1) // 2))))
+
+class IntegrityError(Exception):
+    """Raised when an encrypted file fails authentication."""
+
+class NotChunkedError(IntegrityError):
+    """Raised when a file does not start with a chunked header (it predates the format)."""
 
 def write_file(file_path, data):
     """Write binary data to a file."""
     with open(file_path, 'wb') as f:
         f.write(data)
 
+def _chunk_iv(iv, index):
+    return iv[:8] + struct.pack(">II", index, 0)
+
+def _chunk_mac(hmac_key, header, index, final, ciphertext):
+    mac = new_hmac(hmac_key, header, 'sha256')
+    mac.update(struct.pack(">Q?", index, final))
+    mac.update(ciphertext)
+    return mac.digest()
+
+def _file_keys(password, master_salt, file_salt):
+    master_key = key_cache.default_cache.master_key(password, master_salt)
+    return key_cache.file_keys(master_key, file_salt)
+
+def _read_header(infile, password):
+    """Reads a chunked header and returns (header, chunk_size, aes_key, hmac_key, iv)."""
+    magic = infile.read(len(MAGIC))
+    if magic == MAGIC:
+        header = magic + infile.read(HEADER.size - len(MAGIC))
+        _, chunk_size, master_salt, file_salt = HEADER.unpack(header)
+        return (header, chunk_size) + _file_keys(password, master_salt, file_salt)
+    if magic == MAGIC_V1:
+        header = magic + infile.read(HEADER_V1.size - len(MAGIC))
+        _, chunk_size, salt = HEADER_V1.unpack(header)
+        return (header, chunk_size) + aes.get_key_iv(password, salt)
+    raise NotChunkedError("Not a chunked encrypted file.")
+
+def _readinto_full(stream, buf):
+    """Fill `buf` from `stream`, returning the byte count (short only at EOF)."""
+    view = memoryview(buf)
+    readinto = getattr(stream, 'readinto', None)
+    total = 0
+    while total < len(buf):
+        if readinto is not None:
+            n = readinto(view[total:])
+        else:
+            data = stream.read(len(buf) - total)
+            n = len(data)
+            view[total:total + n] = data
+        if not n:
+            break
+        total += n
+    return total
+
+def encrypt_stream(infile, outfile, password, chunk_size=CHUNK_SIZE):
+    """
+    Encrypt a binary stream chunk by chunk; memory use is bounded by chunk_size.
+    Returns the number of plaintext bytes read.
+    """
+    password = password.encode('utf-8')
+    master_salt = key_cache.default_cache.master_salt(password)
+    file_salt = os.urandom(key_cache.SALT_SIZE)
+    aes_key, hmac_key, iv = _file_keys(password, master_salt, file_salt)
+    cipher = aes.default_engine(aes_key)
+    header = HEADER.pack(MAGIC, chunk_size, master_salt, file_salt)
+    outfile.write(header)
+    buf = bytearray(chunk_size)
+    index = 0
+    total = 0
+    while True:
+        n = _readinto_full(infile, buf)
+        total += n
+        final = n < chunk_size
+        ciphertext = cipher.encrypt_ctr(memoryview(buf)[:n], _chunk_iv(iv, index))
+        outfile.write(ciphertext)
+        outfile.write(_chunk_mac(hmac_key, header, index, final, ciphertext))
+        if final:
+            return total
+        index += 1
+
+def _encrypt_chunks(aes_key, hmac_key, iv, header, chunk_size, first, data, last):
+    """
+    Worker for encrypt_stream_parallel: encrypts the consecutive chunks in
+    `data`, the first of which is chunk `first`, and returns their frames
+    (ciphertext | MAC) in one buffer. If `last`, the final chunk is included,
+    empty when `data` is a whole number of chunks.
+    """
+    cipher = aes.default_engine(aes_key)
+    count = len(data) // chunk_size + (1 if last else 0)
+    out = bytearray(len(data) + count * aes.HMAC_SIZE)
+    src, dst = memoryview(data), memoryview(out)
+    pos = 0
+    for i in range(count):
+        piece = src[i * chunk_size:(i + 1) * chunk_size]
+        ciphertext = cipher.encrypt_ctr(piece, _chunk_iv(iv, first + i))
+        dst[pos:pos + len(ciphertext)] = ciphertext
+        pos += len(ciphertext)
+        final = last and i == count - 1
+        dst[pos:pos + aes.HMAC_SIZE] = _chunk_mac(hmac_key, header, first + i, final, ciphertext)
+        pos += aes.HMAC_SIZE
+    return out
+
+_encrypt_pool = None
+_encrypt_pool_lock = threading.Lock()
+
+def _spawn_pool(workers):
+    # Spawned, not forked: the web server is threaded, and a forked child can
+    # inherit locks (logging, pymongo, the key cache) held by another thread
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def encrypt_pool():
+    """Process pool of ENCRYPT_WORKERS processes shared by all uploads, started on first use."""
+    global _encrypt_pool
+    with _encrypt_pool_lock:
+        if _encrypt_pool is None:
+            _encrypt_pool = _spawn_pool(ENCRYPT_WORKERS)
+        return _encrypt_pool
+
+def encrypt_stream_parallel(infile, outfile, password, pool=None, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Same output as encrypt_stream, but chunks are encrypted in a process pool
+    (encrypt_pool() unless `pool`, of `workers` processes, is given).
+    Keys are derived here once; the stream is handed out in tasks of
+    TASK_CHUNKS chunks and the frames are written back in chunk order, with at
+    most two tasks per worker in flight. Returns the number of plaintext bytes read.
+    """
+    if pool is None:
+        pool, workers = encrypt_pool(), ENCRYPT_WORKERS
+    password = password.encode('utf-8')
+    master_salt = key_cache.default_cache.master_salt(password)
+    file_salt = os.urandom(key_cache.SALT_SIZE)
+    aes_key, hmac_key, iv = _file_keys(password, master_salt, file_salt)
+    header = HEADER.pack(MAGIC, chunk_size, master_salt, file_salt)
+    outfile.write(header)
+    task_size = chunk_size * TASK_CHUNKS
+    pending = deque()
+    index = 0
+    total = 0
+    last = False
+    while not last:
+        buf = bytearray(task_size)
+        n = _readinto_full(infile, buf)
+        total += n
+        last = n < task_size
+        if last:
+            del buf[n:]
+        pending.append(pool.submit(_encrypt_chunks, aes_key, hmac_key, iv, header,
+                                   chunk_size, index, buf, last))
+        index += TASK_CHUNKS
+        while len(pending) >= 2 * workers:
+            outfile.write(pending.popleft().result())
+    while pending:
+        outfile.write(pending.popleft().result())
+    return total
+
+def decrypt_stream(infile, outfile, password):
+    """
+    Authenticate and decrypt a chunked stream written by encrypt_stream.
+    Each chunk is checked before it is written, but chunks already written stay
+    in outfile if a later one fails.
+    """
+    header, chunk_size, aes_key, hmac_key, iv = _read_header(infile, password.encode('utf-8'))
+    cipher = aes.default_engine(aes_key)
+    frame = bytearray(chunk_size + aes.HMAC_SIZE)
+    view = memoryview(frame)
+    index = 0
+    while True:
+        n = _readinto_full(infile, frame)
+        if n < aes.HMAC_SIZE:
+            raise IntegrityError("Encrypted file is truncated.")
+        final = n < len(frame)
+        ciphertext, mac = view[:n - aes.HMAC_SIZE], view[n - aes.HMAC_SIZE:n]
+        if not compare_digest(mac, _chunk_mac(hmac_key, header, index, final, ciphertext)):
+            raise IntegrityError(f"Chunk {index} corrupted or tampered.")
+        outfile.write(cipher.decrypt_ctr(ciphertext, _chunk_iv(iv, index)))
+        if final:
+            return
+        index += 1
+
+def decrypt_bytes(data, password):
+    """Decrypt a whole file from before the chunked format."""
+    try:
+        return aes.decrypt(password.encode('utf-8'), data)
+    except AssertionError as e:
+        raise IntegrityError(str(e)) from e
+
+class ChunkedReader:
+    """
+    Random access to a chunked file in a seekable binary stream. Chunk i starts
+    at header size + i * (chunk size + HMAC_SIZE), so a plaintext byte range is
+    decrypted by reading and authenticating only the chunks that overlap it.
+    The last chunk, which carries the final flag, is authenticated on opening,
+    so `size` is only exposed for files that are not truncated and whose key
+    is right; otherwise IntegrityError is raised.
+    """
+
+    def __init__(self, infile, password):
+        self._file = infile
+        infile.seek(0)
+        self._header, self.chunk_size, aes_key, self._hmac_key, self._iv = _read_header(
+            infile, password.encode('utf-8'))
+        self._cipher = aes.default_engine(aes_key)
+        self._frame_size = self.chunk_size + aes.HMAC_SIZE
+        body = infile.seek(0, os.SEEK_END) - len(self._header)
+        self.chunks = body // self._frame_size + 1
+        last = body - (self.chunks - 1) * self._frame_size
+        if last < aes.HMAC_SIZE:
+            raise IntegrityError("Encrypted file is truncated.")
+        self.size = (self.chunks - 1) * self.chunk_size + last - aes.HMAC_SIZE
+        self.read_chunk(self.chunks - 1)
+
+    def read_chunk(self, index):
+        """Authenticate and decrypt chunk `index`."""
+        if not 0 <= index < self.chunks:
+            raise IndexError(f"Chunk {index} out of range.")
+        final = index == self.chunks - 1
+        self._file.seek(len(self._header) + index * self._frame_size)
+        length = self.size - index * self.chunk_size if final else self.chunk_size
+        frame = self._file.read(length + aes.HMAC_SIZE)
+        if len(frame) != length + aes.HMAC_SIZE:
+            raise IntegrityError("Encrypted file is truncated.")
+        view = memoryview(frame)
+        ciphertext, mac = view[:length], view[length:]
+        if not compare_digest(mac, _chunk_mac(self._hmac_key, self._header, index, final, ciphertext)):
+            raise IntegrityError(f"Chunk {index} corrupted or tampered.")
+        return self._cipher.decrypt_ctr(ciphertext, _chunk_iv(self._iv, index))
+
+    def iter_range(self, start=0, end=None):
+        """
+        An iterator over the plaintext of bytes [start, end), chunk by chunk.
+        The first chunk is authenticated before this returns, so a bad key or a
+        corrupt start raises IntegrityError here rather than mid-iteration.
+        """
+        end = self.size if end is None else min(end, self.size)
+        if start >= end:
+            return iter(())
+        first, last = start // self.chunk_size, (end - 1) // self.chunk_size
+        return self._iter_chunks(self.read_chunk(first), first, last, start, end)
+
+    def _iter_chunks(self, data, first, last, start, end):
+        for index in range(first, last + 1):
+            if index > first:
+                data = self.read_chunk(index)
+            offset = index * self.chunk_size
+            yield data[max(start - offset, 0):end - offset]
+
+    def read_range(self, start, end):
+        """The plaintext of bytes [start, end)."""
+        return b"".join(self.iter_range(start, end))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _Prefixed:
+    """Replays bytes already read from a stream before reading the rest of it."""
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def read(self, size=-1):
+        if not self._prefix:
+            return self._stream.read(size)
+        if size is None or size < 0:
+            data, self._prefix = self._prefix + self._stream.read(), b""
+            return data
+        data, self._prefix = self._prefix[:size], self._prefix[size:]
+        if len(data) < size:
+            data += self._stream.read(size - len(data))
+        return data
+
+    def readinto(self, buf):
+        if not self._prefix:
+            return _readinto_full(self._stream, buf)
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+def _open_input(input_file):
+    return input_file if hasattr(input_file, 'read') else open(input_file, 'rb')
+
 def encrypt_file(input_file, output_file, password):
-    """Encrypt the contents of input_file and write to output_file."""
-    data = read_file(input_file)
-    ciphertext = aes.encrypt(password.encode('utf-8'), data)
-    write_file(output_file, ciphertext)
+    """Encrypt the contents of input_file and write to output_file (may be the same path)."""
+    tmp_path = f"{output_file}.tmp"
+    try:
+        with open(input_file, 'rb') as infile, open(tmp_path, 'wb') as outfile:
+            encrypt_stream(infile, outfile, password)
+        os.replace(tmp_path, output_file)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 def decrypt_file(input_file, output_file, password):
-    """Decrypt the contents of input_file and write to output_file."""
-    data = read_file(input_file)
-    plaintext = aes.decrypt(password.encode('utf-8'), data)
-    write_file(output_file, plaintext)
+    """
+    Decrypt the contents of input_file (a path or binary file object) and write
+    to output_file. Files from before the chunked format are decrypted whole.
+    """
+    infile = _open_input(input_file)
+    try:
+        header = infile.read(len(MAGIC))
+        if header not in (MAGIC, MAGIC_V1):
+            write_file(output_file, decrypt_bytes(header + infile.read(), password))
+            return
+        with open(output_file, 'wb') as outfile:
+            decrypt_stream(_Prefixed(header, infile), outfile, password)
+    finally:
+        if infile is not input_file:
+            infile.close()
+
+def benchmark_parallel(size=32 * 1024 * 1024, worker_counts=(1, 2, 4, 8, 16)):
+    """Times encrypt_stream and encrypt_stream_parallel over `size` random bytes."""
+    import io
+    from timeit import default_timer as timer
+    data = os.urandom(size)
+    password = "benchmark"
+    encrypt_stream(io.BytesIO(), io.BytesIO(), password)   # Cache the master key first
+    start = timer()
+    encrypt_stream(io.BytesIO(data), io.BytesIO(), password)
+    serial = timer() - start
+    print(f"serial: {serial:.2f}s ({size / serial / 1e6:.1f} MB/s)")
+    for workers in worker_counts:
+        with _spawn_pool(workers) as pool:
+            pool.submit(int).result()   # Start the pool outside the timing
+            start = timer()
+            encrypt_stream_parallel(io.BytesIO(data), io.BytesIO(), password, pool, workers)
+            elapsed = timer() - start
+        print(f"{workers:2d} workers: {elapsed:.2f}s ({size / elapsed / 1e6:.1f} MB/s, {serial / elapsed:.1f}x)")
 
 def print_usage():
     print("Usage: python file_encryptor.py [encrypt|decrypt] <input_file> <output_file> <password>")
+    print("       python file_encryptor.py benchmark [size_mb]")
 
 def main():
+    if len(sys.argv) in (2, 3) and sys.argv[1] == 'benchmark':
+        benchmark_parallel(int(sys.argv[2]) * 1024 * 1024 if len(sys.argv) == 3 else 32 * 1024 * 1024)
+        return
     if len(sys.argv) != 5:
         print_usage()
         sys.exit(1)
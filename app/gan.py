@@ -1,31 +1,56 @@
 import os
-import pickle
+import json
 import time
+import hashlib
 import logging
 import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend to avoid Tkinter errors
-import matplotlib.pyplot as plt
-import seaborn as sns
 
-from ctgan import CTGAN
-from scipy.stats import ks_2samp
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import QuantileTransformer
+from app import previews
 
-from app import model_mappings
+# matplotlib, seaborn, scipy, sklearn and torch (through ctgan) are imported
+# where they are used, so processes that only render figures never load torch
+# and importing this module stays cheap; preload() imports them all up front.
 
 # =========================
 # Utility Functions
 # =========================
 
+def pyplot():
+    """matplotlib.pyplot and seaborn, imported on first use."""
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-interactive backend to avoid Tkinter errors
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt, sns
+
+def preload():
+    """Import the whole ML stack now, for dedicated generation workers (JOB_PRELOAD)."""
+    pyplot()
+    import scipy.stats
+    import sklearn.decomposition
+    import sklearn.preprocessing
+    from app import model_registry, warm_ctgan
+
 def safe_filename_component(s):
     """Sanitize string for safe filename usage."""
     return "".join(c for c in s if c.isalnum() or c in (' ', '.', '_')).rstrip()
 
+def dataset_fingerprints(data, discrete_columns):
+    """
+    SHA-256 fingerprints of a preprocessed frame: one of its schema (column
+    names, dtypes and discrete columns) and one of the schema plus every value.
+    """
+    schema = json.dumps([[str(c), str(t)] for c, t in data.dtypes.items()] + [sorted(discrete_columns)])
+    schema_fingerprint = hashlib.sha256(schema.encode("utf-8")).hexdigest()
+    values = pd.util.hash_pandas_object(data, index=False).values
+    data_fingerprint = hashlib.sha256(schema_fingerprint.encode("ascii") + values.tobytes()).hexdigest()
+    return schema_fingerprint, data_fingerprint
+
 def quantile_map(syn_col, orig_col):
     """Map synthetic column values to the quantiles of the original column."""
     sorted_orig = np.sort(orig_col)
@@ -36,9 +61,19 @@ def quantile_map(syn_col, orig_col):
 # Main Synthetic Data Generation
 # =========================
 
-def generate_synthetic_data(decrypted_file_path, username, filename, output_dir="app/static/Uploads"):
+def report(progress, fraction, stage):
+    """Pass a stage to an optional progress(fraction, stage) callback."""
+    if progress is not None:
+        progress(fraction, stage)
+
+def generate_synthetic_data(decrypted_file_path, username, filename, output_dir="app/static/Uploads", progress=None):
     """Generate synthetic data from the decrypted file, using or training a CTGAN model mapped by username and filename."""
+    from sklearn.preprocessing import QuantileTransformer
+    from app import model_registry
+    from app.warm_ctgan import WarmStartCTGAN
+
     # Load and preprocess data
+    report(progress, 0.05, "preprocessing")
     data = pd.read_csv(decrypted_file_path)
     data.columns = (
         data.columns.str.strip()
@@ -71,17 +106,31 @@ def generate_synthetic_data(decrypted_file_path, username, filename, output_dir=
     plot_dir = os.path.join(output_dir, plot_dir_name)
     os.makedirs(plot_dir, exist_ok=True)
 
-    # Model loading or training
-    mapping = model_mappings.find_one({"username": username, "filename": filename})
-    model_path = None
-    if mapping and "model_path" in mapping and os.path.exists(mapping["model_path"]):
-        model_path = mapping["model_path"]
+    # Model loading or training, keyed by what the model is trained on rather than the filename
+    discrete_columns = [target_col] if target_col else []
+    schema_fingerprint, data_fingerprint = dataset_fingerprints(data_scaled, discrete_columns)
+    registry = model_registry.default_registry
+    model_path = registry.lookup(username, "data_fingerprint", data_fingerprint)
+    if model_path is not None:
         logging.info(f"Loading existing CTGAN model for user {username} and file {filename}...")
-        with open(model_path, 'rb') as f:
-            ctgan = pickle.load(f)
+        report(progress, 0.1, "loading model")
+        ctgan = registry.load(model_path)
+        if registry.model_path(username, filename) != model_path:
+            registry.map(username, filename, model_path,
+                         data_fingerprint=data_fingerprint, schema_fingerprint=schema_fingerprint)
     else:
-        logging.info(f"Training new CTGAN model for user {username} and file {filename}...")
-        ctgan = CTGAN(
+        base_path = registry.lookup(username, "schema_fingerprint", schema_fingerprint)
+        base_model = registry.load(base_path) if base_path else None
+        if base_model is not None:
+            logging.info(f"Warm-starting CTGAN for user {username} and file {filename} from {base_path}...")
+        else:
+            logging.info(f"Training new CTGAN model for user {username} and file {filename}...")
+        report(progress, 0.1, "training")
+
+        def epoch_done(epoch, epochs):
+            report(progress, 0.1 + 0.6 * epoch / epochs, f"training epoch {epoch}/{epochs}")
+
+        ctgan = WarmStartCTGAN(
             epochs=100,
             verbose=True,
             generator_lr=1e-4,
@@ -89,23 +138,22 @@ def generate_synthetic_data(decrypted_file_path, username, filename, output_dir=
             batch_size=256,
             pac=1
         )
-        discrete_columns = [target_col] if target_col else []
-        if discrete_columns:
-            ctgan.fit(data_scaled, discrete_columns=discrete_columns)
-        else:
-            ctgan.fit(data_scaled)
-        model_path = os.path.join(output_dir, f"CTGAN_model_{safe_user}_{safe_file}.pkl")
-        with open(model_path, 'wb') as f:
-            pickle.dump(ctgan, f)
-        logging.info(f"Model saved to {model_path}")
-        model_mappings.update_one(
-            {"username": username, "filename": filename},
-            {"$set": {"model_path": model_path}},
-            upsert=True
+        ctgan.fit(
+            data_scaled,
+            discrete_columns=discrete_columns,
+            init_from=base_model,
+            progress=epoch_done
+        )
+        model_path = os.path.join(
+            output_dir, f"CTGAN_model_{safe_user}_{safe_file}_{data_fingerprint[:12]}.pkl"
         )
+        registry.save(username, filename, model_path, ctgan,
+                      data_fingerprint=data_fingerprint, schema_fingerprint=schema_fingerprint)
+        logging.info(f"Model saved to {model_path} after {ctgan.epochs_trained} epochs")
 
     # Generate synthetic data
     logging.info("Generating synthetic samples...")
+    report(progress, 0.7, "sampling")
     synthetic_scaled = ctgan.sample(1000)
     common_cols = [col for col in data_scaled.columns if col in synthetic_scaled.columns]
     synthetic_scaled = synthetic_scaled[common_cols]
@@ -127,12 +175,18 @@ def generate_synthetic_data(decrypted_file_path, username, filename, output_dir=
     synthetic_data.to_csv(save_path, index=False)
     logging.info(f"Saved: {save_path}")
 
+    report(progress, 0.8, "analysing")
     from app.gan import compare_datasets
     analysis_results = compare_datasets(data_rounded, synthetic_data, plot_dir)
 
     relative_path = os.path.relpath(save_path, start="app/static/Uploads").replace("\\", "/")
     analysis_results["synthetic_csv_path"] = relative_path
 
+    # Columnar copy for the paginated preview on the analysis page
+    preview_path = os.path.splitext(save_path)[0] + ".npy"
+    analysis_results["preview"] = previews.save_preview(synthetic_data, preview_path)
+    analysis_results["preview"]["path"] = os.path.relpath(preview_path, start="app/static/Uploads").replace("\\", "/")
+
     return synthetic_data, analysis_results
 
 # =========================
@@ -140,6 +194,7 @@ def generate_synthetic_data(decrypted_file_path, username, filename, output_dir=
 # =========================
 
 def save_correlation_plot(data, filepath):
+    plt, sns = pyplot()
     plt.figure(figsize=(10, 8))
     corr = data.corr()
     sns.heatmap(corr, annot=True, fmt=".2f", cmap="coolwarm")
@@ -149,6 +204,7 @@ def save_correlation_plot(data, filepath):
     plt.close()
 
 def save_distribution_plot(original_data, synthetic_data, filepath):
+    plt, sns = pyplot()
     plt.figure(figsize=(12, 8))
     numeric_cols = original_data.select_dtypes(include=['number']).columns
     for i, col in enumerate(numeric_cols):
@@ -162,6 +218,8 @@ def save_distribution_plot(original_data, synthetic_data, filepath):
     plt.close()
 
 def save_pca_plot(original_data, synthetic_data, filepath):
+    from sklearn.decomposition import PCA
+    plt, _ = pyplot()
     pca = PCA(n_components=2)
     combined = pd.concat([original_data, synthetic_data])
     pca_result = pca.fit_transform(combined)
@@ -177,7 +235,108 @@ def save_pca_plot(original_data, synthetic_data, filepath):
 # Dataset Comparison & Analysis
 # =========================
 
+# Figures are rendered in worker processes; results are cached on disk by data hash
+FIGURE_WORKERS = int(os.getenv("FIGURE_WORKERS", 3))
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", "analysis_cache")
+_figure_pool = None
+
+def figure_pool():
+    """Process pool for figure rendering, started on first use and kept for later analyses."""
+    global _figure_pool
+    if _figure_pool is None:
+        _figure_pool = ProcessPoolExecutor(
+            max_workers=FIGURE_WORKERS, mp_context=multiprocessing.get_context("spawn"), initializer=pyplot
+        )
+    return _figure_pool
+
+def ks_statistics(original, synthetic):
+    """
+    Two-sample KS statistic and p-value for every column of two numeric frames
+    at once. Both samples are stacked and argsorted per column; the running sum
+    of +1/n for original rows and -1/m for synthetic rows is F_orig - F_synth,
+    read off at the last row of each run of tied values. P-values use the
+    asymptotic distribution (ks_2samp's method="asymp").
+    """
+    from scipy.stats import kstwo
+    x = original.to_numpy(dtype=float)
+    y = synthetic.to_numpy(dtype=float)
+    n, m = len(x), len(y)
+    combined = np.concatenate([x, y])
+    order = np.argsort(combined, axis=0, kind="stable")
+    values = np.take_along_axis(combined, order, axis=0)
+    cdf_diff = np.cumsum(np.where(order < n, 1.0 / n, -1.0 / m), axis=0)
+    run_end = np.ones(values.shape, dtype=bool)
+    run_end[:-1] = values[1:] != values[:-1]
+    stats = np.max(np.abs(cdf_diff) * run_end, axis=0)
+    p_values = np.clip(kstwo.sf(stats, np.round(n * m / (n + m))), 0, 1)
+    return stats, p_values
+
+def analysis_key(original_data, synthetic_data):
+    """SHA-256 of both frames' columns and values."""
+    digest = hashlib.sha256()
+    for frame in (original_data, synthetic_data):
+        digest.update(json.dumps([str(c) for c in frame.columns]).encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+    return digest.hexdigest()
+
+def load_cached_analysis(cache_path):
+    """A cached analysis whose figures still exist, or None."""
+    try:
+        with open(cache_path) as f:
+            results = json.load(f)
+    except (OSError, ValueError):
+        return None
+    for plot in results["plot_infos"]:
+        if not os.path.exists(os.path.join("app", "static", plot["path"])):
+            return None
+    return results
+
+def save_top_correlation_plot(original_data, synthetic_data, filepath):
+    plt, sns = pyplot()
+    plt.figure(figsize=(6, 5))
+    combined_corr_data = pd.concat([original_data, synthetic_data], ignore_index=True)
+    sns.heatmap(combined_corr_data.corr(), annot=True, fmt=".2f", cmap="coolwarm", cbar=False)
+    plt.title("Correlation matrix of combined original and synthetic data (Top-6 Features)")
+    plt.tight_layout()
+    plt.savefig(filepath)
+    plt.close()
+
+def save_top_distribution_plot(original_data, synthetic_data, filepath):
+    plt, sns = pyplot()
+    plt.figure(figsize=(12, 8))
+    for i, col in enumerate(original_data.columns, 1):
+        ax = plt.subplot(2, 3, i)
+        sns.kdeplot(original_data[col], label="Orig", fill=True, alpha=0.4)
+        sns.kdeplot(synthetic_data[col], label="Synth", fill=True, alpha=0.4)
+        ax.set_title(col)
+        ax.legend()
+    plt.tight_layout()
+    plt.savefig(filepath)
+    plt.close()
+
+def save_top_pca_plot(original_data, synthetic_data, filepath):
+    from sklearn.decomposition import PCA
+    plt, _ = pyplot()
+    pca = PCA(n_components=2)
+    combined = pd.concat([original_data, synthetic_data], ignore_index=True)
+    comps = pca.fit_transform(combined)
+    n1 = len(original_data)
+    plt.figure(figsize=(7, 6))
+    plt.scatter(comps[:n1, 0], comps[:n1, 1], alpha=0.5, label="Orig")
+    plt.scatter(comps[n1:, 0], comps[n1:, 1], alpha=0.5, label="Synth")
+    plt.title("PCA on Top-6 Features")
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(filepath)
+    plt.close()
+
 def compare_datasets(original_data, synthetic_data, folder_path):
+    cache_path = os.path.join(ANALYSIS_CACHE_DIR, f"{analysis_key(original_data, synthetic_data)}.json")
+    cached = load_cached_analysis(cache_path)
+    if cached is not None:
+        logging.info(f"Reusing cached analysis {cache_path}")
+        return cached
+
     # Helpers for HTML
     def summary_html(orig_df, synth_df, features):
         orig_desc = orig_df[features].describe().round(2)
@@ -193,11 +352,8 @@ def compare_datasets(original_data, synthetic_data, folder_path):
 
     def ks_html(orig, synth):
         numeric = orig.select_dtypes(include="number").columns
-        records = []
-        for c in numeric:
-            stat, p = ks_2samp(orig[c], synth[c])
-            records.append((c, stat, p))
-        ksdf = pd.DataFrame(records, columns=["Feature", "KS Stat", "P-Value"])
+        stats, p_values = ks_statistics(orig[numeric], synth[numeric])
+        ksdf = pd.DataFrame({"Feature": numeric, "KS Stat": stats, "P-Value": p_values})
         ksdf.sort_values("KS Stat", ascending=False, inplace=True)
         top10 = ksdf.head(10).round(4)
         avg_ks_stat = ksdf["KS Stat"].mean()
@@ -207,59 +363,30 @@ def compare_datasets(original_data, synthetic_data, folder_path):
     ks_table_html, full_ks, avg_ks_stat = ks_html(original_data, synthetic_data)
     top6 = full_ks.sort_values("KS Stat", ascending=False).head(6)["Feature"].tolist()
 
-    # 1) Summary & KS
+    # 2-4) Correlation, distribution overlays and PCA of top6, rendered in parallel
+    figures = [
+        (save_top_correlation_plot, "corr_top6.png",
+         "Correlation matrix of combined original and synthetic data for the top 6 most dissimilar features."),
+        (save_top_distribution_plot, "dist_top6.png",
+         "Distribution overlays comparing original and synthetic data for the top 6 most dissimilar features."),
+        (save_top_pca_plot, "pca_top6.png",
+         "2D PCA projection of original and synthetic data for the top 6 most dissimilar features.")
+    ]
+    pool = figure_pool()
+    renders = [
+        pool.submit(render, original_data[top6], synthetic_data[top6], os.path.join(folder_path, name))
+        for render, name, _ in figures
+    ]
+
+    # 1) Summary & KS, while the figures render
     orig_summary_html, synth_summary_html = summary_html(original_data, synthetic_data, top6)
     plots = []
-
-    # 2) Correlation of top6
-    corr_path = os.path.join(folder_path, "corr_top6.png")
-    plt.figure(figsize=(6, 5))
-    combined_corr_data = pd.concat([original_data[top6], synthetic_data[top6]], ignore_index=True)
-    sns.heatmap(combined_corr_data.corr(), annot=True, fmt=".2f", cmap="coolwarm", cbar=False)
-    plt.title("Correlation matrix of combined original and synthetic data (Top-6 Features)")
-    plt.tight_layout()
-    plt.savefig(corr_path)
-    plt.close()
-    plots.append({
-        "path": os.path.relpath(corr_path, os.path.join("app", "static")).replace("\\", "/"),
-        "caption": "Correlation matrix of combined original and synthetic data for the top 6 most dissimilar features."
-    })
-
-    # 3) Distribution overlays for top6
-    dist_path = os.path.join(folder_path, "dist_top6.png")
-    plt.figure(figsize=(12, 8))
-    for i, col in enumerate(top6, 1):
-        ax = plt.subplot(2, 3, i)
-        sns.kdeplot(original_data[col], label="Orig", fill=True, alpha=0.4)
-        sns.kdeplot(synthetic_data[col], label="Synth", fill=True, alpha=0.4)
-        ax.set_title(col)
-        ax.legend()
-    plt.tight_layout()
-    plt.savefig(dist_path)
-    plt.close()
-    plots.append({
-        "path": os.path.relpath(dist_path, os.path.join("app", "static")).replace("\\", "/"),
-        "caption": "Distribution overlays comparing original and synthetic data for the top 6 most dissimilar features."
-    })
-
-    # 4) PCA on top6
-    pca_path = os.path.join(folder_path, "pca_top6.png")
-    pca = PCA(n_components=2)
-    combined = pd.concat([original_data[top6], synthetic_data[top6]], ignore_index=True)
-    comps = pca.fit_transform(combined)
-    n1 = len(original_data)
-    plt.figure(figsize=(7, 6))
-    plt.scatter(comps[:n1, 0], comps[:n1, 1], alpha=0.5, label="Orig")
-    plt.scatter(comps[n1:, 0], comps[n1:, 1], alpha=0.5, label="Synth")
-    plt.title("PCA on Top-6 Features")
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(pca_path)
-    plt.close()
-    plots.append({
-        "path": os.path.relpath(pca_path, os.path.join("app", "static")).replace("\\", "/"),
-        "caption": "2D PCA projection of original and synthetic data for the top 6 most dissimilar features."
-    })
+    for (_, name, caption), render in zip(figures, renders):
+        render.result()
+        plots.append({
+            "path": os.path.relpath(os.path.join(folder_path, name), os.path.join("app", "static")).replace("\\", "/"),
+            "caption": caption
+        })
 
     # 5) Interpretation
     interp = (
@@ -272,11 +399,16 @@ def compare_datasets(original_data, synthetic_data, folder_path):
         "</div>"
     )
 
-    return {
+    results = {
         "orig_summary_html": orig_summary_html,
         "synth_summary_html": synth_summary_html,
         "ks_html": ks_table_html,
         "plot_infos": plots,
         "interpretation": interp,
-        "average_ks_stat": avg_ks_stat
+        "average_ks_stat": float(avg_ks_stat)
     }
+    os.makedirs(ANALYSIS_CACHE_DIR, exist_ok=True)
+    with open(f"{cache_path}.tmp", "w") as f:
+        json.dump(results, f)
+    os.replace(f"{cache_path}.tmp", cache_path)
+    return results
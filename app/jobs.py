@@ -0,0 +1,352 @@
+import os
+import json
+import atexit
+import time
+import uuid
+import sqlite3
+import logging
+import tempfile
+import threading
+import traceback
+import multiprocessing
+from contextlib import closing
+
+from app import app, public_files, users, file_encryptor, datasets
+from app.blob_store import BlobStore
+
+# Seconds an idle worker waits before looking for a queued job again
+POLL_INTERVAL = 0.5
+# Seconds between a running job's heartbeats, and how long a running job may go
+# without one before it is considered abandoned and queued again
+HEARTBEAT_INTERVAL = 10
+STALE_AFTER = 60
+# Seconds between checks for worker processes that died
+SUPERVISE_INTERVAL = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id       TEXT PRIMARY KEY,
+    kind     TEXT NOT NULL,
+    username TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    status   TEXT NOT NULL,      -- queued, running, done or failed
+    progress REAL NOT NULL DEFAULT 0,
+    stage    TEXT,
+    result   TEXT,               -- JSON, once done
+    error    TEXT,
+    worker   TEXT,
+    created  REAL NOT NULL,
+    updated  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS jobs_request ON jobs (kind, username, filename, status);
+"""
+
+class JobQueue:
+    """
+    Persistent job queue in a local SQLite database, shared by the web
+    processes that submit jobs and the worker processes that run them.
+    Every call opens its own connection, so one queue object can be used from
+    any thread.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def submit(self, kind, username, filename):
+        """
+        Queue a job and return (job_id, created). A job of the same kind for
+        the same user and file that is still queued, or running with a recent
+        heartbeat, is returned instead of queueing a duplicate. A running job
+        whose heartbeat is stale is marked failed and replaced.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND username = ? AND filename = ?"
+                " AND (status = 'queued' OR (status = 'running' AND updated >= ?))",
+                (kind, username, filename, now - STALE_AFTER)
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return row["id"], False
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', stage = 'failed', error = ?, updated = ?"
+                " WHERE kind = ? AND username = ? AND filename = ? AND status = 'running'",
+                (f"Abandoned by its worker; resubmitted as {job_id}", now, kind, username, filename)
+            )
+            conn.execute(
+                "INSERT INTO jobs (id, kind, username, filename, status, stage, created, updated)"
+                " VALUES (?, ?, ?, ?, 'queued', 'queued', ?, ?)",
+                (job_id, kind, username, filename, now, now)
+            )
+            conn.execute("COMMIT")
+            return job_id, True
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def claim(self, worker):
+        """Mark the oldest queued job as running on `worker` and return it, or None."""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', stage = 'starting', worker = ?, updated = ? WHERE id = ?",
+                (worker, time.time(), row["id"])
+            )
+            conn.execute("COMMIT")
+            return dict(row)
+
+    def progress(self, job_id, progress, stage):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, stage = ?, updated = ? WHERE id = ?",
+                (progress, stage, time.time(), job_id)
+            )
+
+    def finish(self, job_id, result):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', progress = 1, stage = 'done', result = ?, updated = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id)
+            )
+
+    def fail(self, job_id, error):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', stage = 'failed', error = ?, updated = ? WHERE id = ?",
+                (error, time.time(), job_id)
+            )
+
+    def heartbeat(self, job_id):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET updated = ? WHERE id = ? AND status = 'running'",
+                (time.time(), job_id)
+            )
+
+    def requeue_stale(self, stale_after=STALE_AFTER):
+        """
+        Put running jobs that have not been updated for `stale_after` seconds,
+        whose workers died, back in the queue. Jobs of live workers, in this
+        process's pool or any other, keep heartbeating and are left alone.
+        Returns the count.
+        """
+        with closing(self._connect()) as conn:
+            now = time.time()
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', stage = 'queued', progress = 0, worker = NULL,"
+                " updated = ? WHERE status = 'running' AND updated < ?",
+                (now, now - stale_after)
+            )
+            return cursor.rowcount
+
+    def requeue_worker(self, worker):
+        """Put the running jobs of a worker that was stopped or died back in the queue. Returns the count."""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', stage = 'queued', progress = 0, worker = NULL,"
+                " updated = ? WHERE status = 'running' AND worker = ?",
+                (time.time(), worker)
+            )
+            return cursor.rowcount
+
+# ------------------ Job handlers ------------------
+
+def generate_dataset_job(job, progress):
+    """Decrypt an upload, generate and analyse a synthetic dataset and publish it."""
+    from app import gan, model_registry
+    username, filename = job["username"], job["filename"]
+    user = users.find_one({"username": username}, {"password": 1})
+    if user is None:
+        raise ValueError(f"Unknown user {username}")
+    digest = datasets.upload_digest(username, filename)
+    if digest is not None:
+        enc_file = BlobStore(app.config['BLOB_STORE_DIR']).open(digest)
+    else:
+        enc_file = open(datasets.legacy_upload_path(filename), 'rb')
+    fd, decrypted_file_path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        progress(0.02, "decrypting")
+        with enc_file:
+            file_encryptor.decrypt_file(enc_file, decrypted_file_path, user["password"])
+        _, analysis_results = gan.generate_synthetic_data(
+            decrypted_file_path, username, filename,
+            output_dir=app.config['UPLOAD_FOLDER'], progress=progress
+        )
+    finally:
+        if os.path.exists(decrypted_file_path):
+            os.remove(decrypted_file_path)
+    progress(0.95, "publishing")
+    relative_path = analysis_results["synthetic_csv_path"]
+    synthetic_csv_path = os.path.join(app.config['UPLOAD_FOLDER'], relative_path)
+    model_path = model_registry.default_registry.model_path(username, filename) or "CTGAN"
+    doc = {
+        "synthetic_file_path": synthetic_csv_path,
+        "model_name": model_path,
+        "uploader_username": username,
+        "analysis_results": analysis_results
+    }
+    doc["summary"] = datasets.summary(doc)
+    public_files.update_one(
+        {"dataset_id": datasets.dataset_id(relative_path)},
+        {"$set": doc},
+        upsert=True
+    )
+    return {
+        "synthetic_csv_path": relative_path,
+        "average_ks_stat": float(analysis_results["average_ks_stat"])
+    }
+
+HANDLERS = {
+    "generate_dataset": generate_dataset_job
+}
+
+# ------------------ Workers ------------------
+
+def run_job(queue, job):
+    def progress(fraction, stage):
+        queue.progress(job["id"], fraction, stage)
+
+    # Heartbeats keep the job from looking abandoned through long stages
+    # (a training epoch) that do not report progress
+    done = threading.Event()
+    def heartbeat():
+        while not done.wait(HEARTBEAT_INTERVAL):
+            queue.heartbeat(job["id"])
+    threading.Thread(target=heartbeat, daemon=True).start()
+    try:
+        result = HANDLERS[job["kind"]](job, progress)
+    except Exception as e:
+        logging.error(f"Job {job['id']} failed: {str(e)}")
+        logging.error(traceback.format_exc())
+        queue.fail(job["id"], str(e))
+    else:
+        queue.finish(job["id"], result)
+    finally:
+        done.set()
+
+def worker_main(db_path, name):
+    """Worker process loop: claim the oldest queued job, run it, repeat."""
+    if app.config['JOB_PRELOAD']:
+        from app import gan
+        gan.preload()
+    queue = JobQueue(db_path)
+    while True:
+        # Any worker, here or in another process, picks up jobs whose worker died
+        requeued = queue.requeue_stale()
+        if requeued:
+            logging.info(f"{name} requeued {requeued} abandoned jobs")
+        job = queue.claim(name)
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        logging.info(f"{name} running job {job['id']} ({job['kind']} {job['filename']})")
+        run_job(queue, job)
+
+class WorkerPool:
+    """
+    Worker processes started by this process. A supervisor thread replaces
+    workers that die (e.g. killed for running out of memory) and requeues the
+    job they were running. Worker names include this process's PID, so a
+    job's `worker` column tells which pool owns it.
+    """
+
+    def __init__(self, db_path, count):
+        self.queue = JobQueue(db_path)
+        self.db_path = db_path
+        self.names = [f"job-worker-{os.getpid()}-{i}" for i in range(count)]
+        self.workers = {}
+        self._context = multiprocessing.get_context("spawn")
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def _spawn(self, name):
+        # Not daemonic, so jobs can use process pools of their own (gan renders
+        # figures in one); stop() ends them when this process exits.
+        worker = self._context.Process(target=worker_main, args=(self.db_path, name), name=name)
+        worker.start()
+        self.workers[name] = worker
+
+    def start(self):
+        with self._lock:
+            for name in self.names:
+                self._spawn(name)
+        threading.Thread(target=self._supervise, name="job-supervisor", daemon=True).start()
+        atexit.register(self.stop)
+        return self
+
+    def _supervise(self):
+        while not self._stopping.wait(SUPERVISE_INTERVAL):
+            with self._lock:
+                if self._stopping.is_set():
+                    return
+                for name, worker in list(self.workers.items()):
+                    if worker.is_alive():
+                        continue
+                    requeued = self.queue.requeue_worker(name)
+                    logging.warning(f"{name} exited with code {worker.exitcode}; restarting it"
+                                    f" and requeueing {requeued} jobs")
+                    self._spawn(name)
+
+    def stop(self):
+        """Terminate the workers and put the jobs they were running back in the queue."""
+        with self._lock:
+            if self._stopping.is_set():
+                return
+            self._stopping.set()
+            for worker in self.workers.values():
+                if worker.is_alive():
+                    worker.terminate()
+            for name, worker in self.workers.items():
+                worker.join()
+                self.queue.requeue_worker(name)
+
+    def join(self):
+        while not self._stopping.is_set():
+            self._stopping.wait(SUPERVISE_INTERVAL)
+
+def start_workers(db_path=None, count=None):
+    """
+    Start a WorkerPool of `count` processes (JOB_WORKERS by default), which is
+    also the number of jobs that can run at once. Jobs abandoned by workers
+    that died are queued again first; with count 0 nothing is started and the
+    queue is left to the workers running elsewhere.
+    """
+    db_path = db_path or app.config['JOB_DB_PATH']
+    count = app.config['JOB_WORKERS'] if count is None else count
+    if count <= 0:
+        return None
+    requeued = JobQueue(db_path).requeue_stale()
+    if requeued:
+        logging.info(f"Requeued {requeued} abandoned jobs")
+    return WorkerPool(db_path, count).start()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    pool = start_workers()
+    if pool is not None:
+        pool.join()
@@ -0,0 +1,112 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from hashlib import pbkdf2_hmac, sha256
+from hmac import new as new_hmac
+
+from app import aes
+
+# Same work factor as aes.get_key_iv, paid once per user and master salt
+MASTER_KEY_WORKLOAD = 100000
+MASTER_KEY_SIZE = 32
+SALT_SIZE = 16
+
+class DerivedKeyCache:
+    """
+    Process-local cache of PBKDF2 master keys with a TTL, a size bound and LRU
+    eviction. Entries are keyed by a SHA-256 of the password and the master
+    salt, so the password itself is never stored.
+
+    Each user gets a master key from one PBKDF2 run; file keys are then
+    expanded from it with HMAC (see file_keys), so repeated downloads and
+    analyses of the same user's files skip the 100k-iteration KDF while every
+    file still has its own key.
+    """
+
+    def __init__(self, max_entries=1024, ttl=900):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()   # (password digest, salt) -> (key, expiry)
+        self._salts = {}                # password digest -> salt for new files
+        self._lock = threading.Lock()
+
+    def _lookup(self, cache_key, now):
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del self._entries[cache_key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(cache_key)
+        return entry[0]
+
+    def master_key(self, password, salt):
+        """The master key for `password` and `salt`, derived at most once per TTL."""
+        cache_key = (sha256(password).digest(), salt)
+        with self._lock:
+            key = self._lookup(cache_key, time.monotonic())
+            if key is not None:
+                self.hits += 1
+                return key
+            self.misses += 1
+        key = pbkdf2_hmac('sha256', password, salt, MASTER_KEY_WORKLOAD, MASTER_KEY_SIZE)
+        with self._lock:
+            self._entries[cache_key] = (key, time.monotonic() + self.ttl)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return key
+
+    def master_salt(self, password):
+        """
+        The salt to use for a new file. It is reused while the user's master key
+        is cached, and a fresh one is drawn once it has expired.
+        """
+        digest = sha256(password).digest()
+        with self._lock:
+            salt = self._salts.get(digest)
+            if salt is not None and self._lookup((digest, salt), time.monotonic()) is not None:
+                return salt
+            salt = os.urandom(SALT_SIZE)
+            self._salts[digest] = salt
+            if len(self._salts) > self.max_entries:
+                self._salts.pop(next(iter(self._salts)))
+            return salt
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl
+            }
+
+def file_keys(master_key, file_salt):
+    """
+    HKDF-Expand (RFC 5869) of the master key into a per-file AES key, HMAC key
+    and IV.
+    """
+    length = aes.AES_KEY_SIZE + aes.HMAC_KEY_SIZE + aes.IV_SIZE
+    okm, block, counter = b"", b"", 1
+    while len(okm) < length:
+        block = new_hmac(master_key, block + b"file-key" + file_salt + bytes([counter]), 'sha256').digest()
+        okm += block
+        counter += 1
+    aes_key = okm[:aes.AES_KEY_SIZE]
+    hmac_key = okm[aes.AES_KEY_SIZE:aes.AES_KEY_SIZE + aes.HMAC_KEY_SIZE]
+    iv = okm[aes.AES_KEY_SIZE + aes.HMAC_KEY_SIZE:length]
+    return aes_key, hmac_key, iv
+
+default_cache = DerivedKeyCache(
+    max_entries=int(os.getenv('KEY_CACHE_SIZE', 1024)),
+    ttl=int(os.getenv('KEY_CACHE_TTL', 900))
+)
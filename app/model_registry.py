@@ -0,0 +1,210 @@
+import io
+import os
+import time
+import pickle
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+import torch
+from ctgan.synthesizers.ctgan import Generator
+
+from app import model_mappings
+
+# --- On-disk model format ---
+#
+# <name>.pkl : pickled {"model": CTGAN without its generator, "training": bool}
+# <name>.pt  : the generator's state_dict, saved with torch.save
+#
+# The weights are loaded with mmap=True, so a cold load does not copy them into
+# the heap and worker processes loading the same model share its pages through
+# the page cache. Models saved before this format are a single pickled CTGAN
+# with no .pt file next to them; they are still loaded and are rewritten in the
+# new format on first use.
+
+def mapping_filter(username, filename):
+    return {"username": username, "filename": filename}
+
+def weights_path(model_path):
+    return os.path.splitext(model_path)[0] + ".pt"
+
+def _replace(path, data):
+    """
+    Write `data` to a unique temp file next to `path` and rename it into place,
+    so processes saving the same model never share a temp file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def save_model(ctgan, model_path):
+    """Write a trained CTGAN as metadata plus a memory-mappable state_dict."""
+    generator = ctgan._generator
+    ctgan._generator = None
+    try:
+        meta = pickle.dumps({"model": ctgan, "training": generator.training})
+    finally:
+        ctgan._generator = generator
+    weights = io.BytesIO()
+    torch.save(generator.state_dict(), weights)
+    _replace(weights_path(model_path), weights.getbuffer())
+    _replace(model_path, meta)
+
+def export_model(model_path):
+    """A whole-object pickle of the model at model_path, loadable without this module."""
+    return pickle.dumps(load_model(model_path))
+
+def load_model(model_path):
+    """Load a CTGAN written by save_model, or a legacy whole-object pickle."""
+    with open(model_path, 'rb') as f:
+        meta = pickle.load(f)
+    if not isinstance(meta, dict):
+        return meta
+    ctgan = meta["model"]
+    state = torch.load(weights_path(model_path), map_location="cpu", mmap=True, weights_only=True)
+    generator = Generator(
+        ctgan._embedding_dim + ctgan._data_sampler.dim_cond_vec(),
+        ctgan._generator_dim,
+        ctgan._transformer.output_dimensions
+    )
+    generator.load_state_dict(state, assign=True)
+    generator.train(meta["training"])
+    ctgan._generator = generator.to(ctgan._device)
+    return ctgan
+
+def model_size(ctgan, model_path):
+    """Approximate resident size: generator tensors plus the pickled metadata."""
+    tensors = list(ctgan._generator.parameters()) + list(ctgan._generator.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors) + os.path.getsize(model_path)
+
+class ModelRegistry:
+    """
+    Process-wide cache of trained CTGAN models.
+
+    Loaded models are kept in an LRU bounded by their approximate size in
+    bytes, and the model_mappings lookups (by username and filename, or by
+    data or schema fingerprint) are cached alongside, so a warm request for a
+    known model touches neither Mongo nor the model files.
+    """
+
+    def __init__(self, mappings, max_bytes=512 * 1024 * 1024):
+        self.mappings = mappings
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._models = OrderedDict()    # model path -> (ctgan, size)
+        self._paths = {}                # (username, filename) or (username, field, fingerprint) -> model path
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def model_path(self, username, filename):
+        """Path of the model mapped to a user's file, or None if there is none on disk."""
+        key = (username, filename)
+        with self._lock:
+            path = self._paths.get(key)
+        if path is None:
+            mapping = self.mappings.find_one(mapping_filter(username, filename), {"model_path": 1})
+            path = mapping.get("model_path") if mapping else None
+        if path is None or not os.path.exists(path):
+            with self._lock:
+                self._paths.pop(key, None)
+            return None
+        with self._lock:
+            self._paths[key] = path
+        return path
+
+    def lookup(self, username, field, fingerprint):
+        """
+        Path of the newest model of `username` whose mapping has `field`
+        (data_fingerprint or schema_fingerprint) equal to `fingerprint`, or None.
+        Models are only ever shared between a user's own files.
+        """
+        key = (username, field, fingerprint)
+        with self._lock:
+            path = self._paths.get(key)
+        if path is None:
+            mapping = self.mappings.find_one(
+                {"username": username, field: fingerprint},
+                {"model_path": 1},
+                sort=[("updated", -1)]
+            )
+            path = mapping.get("model_path") if mapping else None
+        if path is None or not os.path.exists(path):
+            with self._lock:
+                self._paths.pop(key, None)
+            return None
+        with self._lock:
+            self._paths[key] = path
+        return path
+
+    def map(self, username, filename, model_path, **fingerprints):
+        """Point a user's file at model_path, recording the data and schema fingerprints."""
+        self.mappings.update_one(
+            mapping_filter(username, filename),
+            {"$set": dict(fingerprints, model_path=model_path, updated=time.time())},
+            upsert=True
+        )
+        with self._lock:
+            self._paths[(username, filename)] = model_path
+            for field, fingerprint in fingerprints.items():
+                self._paths[(username, field, fingerprint)] = model_path
+
+    def load(self, model_path):
+        """The model at model_path, from memory when it is still cached."""
+        with self._lock:
+            entry = self._models.get(model_path)
+            if entry is not None:
+                self._models.move_to_end(model_path)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        ctgan = load_model(model_path)
+        if not os.path.exists(weights_path(model_path)):
+            logging.info(f"Converting {model_path} to memory-mapped weights")
+            save_model(ctgan, model_path)
+        self._insert(model_path, ctgan)
+        return ctgan
+
+    def save(self, username, filename, model_path, ctgan, **fingerprints):
+        """Store a newly trained model, map the user's file to it and cache it."""
+        save_model(ctgan, model_path)
+        self.map(username, filename, model_path, **fingerprints)
+        self._insert(model_path, ctgan)
+
+    def _insert(self, model_path, ctgan):
+        size = model_size(ctgan, model_path)
+        with self._lock:
+            old = self._models.pop(model_path, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._models[model_path] = (ctgan, size)
+            self._bytes += size
+            # Always keep the newest model, even if it is over budget on its own
+            while self._bytes > self.max_bytes and len(self._models) > 1:
+                _, (_, evicted) = self._models.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "models": len(self._models),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes
+            }
+
+default_registry = ModelRegistry(
+    model_mappings,
+    max_bytes=int(os.getenv('MODEL_CACHE_BYTES', 512 * 1024 * 1024))
+)
@@ -0,0 +1,36 @@
+import numpy as np
+
+# Rows shown per page of a synthetic dataset preview
+PAGE_ROWS = 50
+
+def save_preview(frame, npy_path):
+    """
+    Store a numeric frame's values as a float64 .npy file and return the
+    preview descriptor kept in Mongo (path is filled in by the caller).
+    """
+    np.save(npy_path, frame.to_numpy(dtype=np.float64))
+    return {"columns": [str(c) for c in frame.columns], "rows": len(frame)}
+
+def preview_from_csv(csv_path, npy_path):
+    """Build the preview of a synthetic CSV written before previews were stored."""
+    import pandas as pd
+    frame = pd.read_csv(csv_path).apply(pd.to_numeric, errors="coerce")
+    return save_preview(frame, npy_path)
+
+def read_window(preview, npy_path, page, page_rows=PAGE_ROWS):
+    """
+    One page of rows. The array is memory-mapped, so only the requested
+    window is read, however large the dataset is.
+    """
+    values = np.load(npy_path, mmap_mode="r")
+    pages = max(1, -(-preview["rows"] // page_rows))
+    page = min(max(page, 1), pages)
+    first = (page - 1) * page_rows
+    return {
+        "columns": preview["columns"],
+        "rows": np.array(values[first:first + page_rows]).tolist(),
+        "first": first,
+        "page": page,
+        "pages": pages,
+        "total": preview["rows"]
+    }
@@ -1,32 +1,42 @@
 import os
-import json
-import base64
-import tempfile
 import traceback
 import urllib.parse
-import re
 import requests
 from timeit import default_timer as timer
 from bson.objectid import ObjectId
 from flask import (
-    render_template, redirect, request, send_file, flash, url_for, jsonify,
-    send_from_directory, abort
+    render_template, redirect, request, flash, url_for, jsonify,
+    send_from_directory, abort, Response
 )
 from flask_login import (
     login_user, logout_user, current_user, login_required
 )
+from markupsafe import Markup
 from werkzeug.utils import secure_filename, safe_join
 
-from app import app, public_files, file_encryptor, bcrypt, login_manager, users
+from app import app, public_files, file_encryptor, key_cache, previews, datasets, bcrypt, login_manager, users
+from app.jobs import JobQueue
+from app.blob_store import BlobStore
+from app.chain_index import ChainIndex
+from Block import Block
+from Blockchain import Blockchain
 
 # Constants
 UPLOAD_FOLDER = os.path.abspath("app/static/Uploads")
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 ADDR = "http://127.0.0.1:8800"
+PREVIEW_ROWS = 20
+MAX_PREVIEW_ROWS = 1000
+PUBLIC_PAGE_SIZE = 50
+PUBLIC_SORTS = {
+    "uploader": [("uploader_username", 1), ("_id", 1)],
+    "newest": [("_id", -1)]
+}
+blob_store = BlobStore(app.config['BLOB_STORE_DIR'])
+job_queue = JobQueue(app.config['JOB_DB_PATH'])
 
 # Globals
-request_tx = []
-files = {}
+chain_index = ChainIndex(ADDR)
 
 # ------------------ User Model & Auth ------------------
 
@@ -69,57 +79,46 @@ def load_user(user_id):
 def insert_public_file(synthetic_file_path, model_name, uploader_username):
     """Insert a document into the public_files collection."""
     doc = {
+        "dataset_id": datasets.dataset_id(synthetic_file_path),
         "synthetic_file_path": synthetic_file_path,
         "model_name": model_name,
         "uploader_username": uploader_username
     }
+    doc["summary"] = datasets.summary(doc)
     app.logger.debug(f"Inserting document into public_files: {doc}")
     result = public_files.insert_one(doc)
     app.logger.debug(f"Document inserted with id: {result.inserted_id}")
     return result.inserted_id
 
+def fetch_block(block_index):
+    """Fetch a single block from the node, or None if it does not exist."""
+    resp = requests.get(f"{ADDR}/blocks/{block_index}")
+    if resp.status_code != 200:
+        return None
+    return resp.json()
+
 def get_tx_req():
-    """Fetch and sort transaction requests from the blockchain."""
-    global request_tx
-    chain_addr = f"{ADDR}/chain"
-    resp = requests.get(chain_addr)
-    if resp.status_code == 200:
-        content = []
-        chain = json.loads(resp.content.decode())
-        for block in chain["chain"]:
-            for trans in block["transactions"]:
-                trans["index"] = block["index"]
-                trans["hash"] = block["prev_hash"]
-                content.append(trans)
-        request_tx = sorted(content, key=lambda k: k["hash"], reverse=True)
-
-def delete_temp_file(filepath):
-    """Force delete file with multiple strategies."""
+    """Return an up-to-date snapshot of the transactions on the chain."""
     try:
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            app.logger.debug(f"Deleted temp file: {filepath}")
-            return
-        app.logger.warning(f"Temp file not found: {filepath}")
-    except Exception as e:
-        app.logger.warning(f"First delete attempt failed: {str(e)}")
-        import time
-        time.sleep(1)
-        try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                app.logger.debug(f"Force deleted after delay: {filepath}")
-                return
-        except Exception as e:
-            app.logger.warning(f"Force delete failed: {str(e)}")
-            try:
-                if os.path.exists(filepath):
-                    temp_name = f"{filepath}.deleteme"
-                    os.rename(filepath, temp_name)
-                    os.remove(temp_name)
-                    app.logger.debug(f"Used rename-and-delete for: {filepath}")
-            except Exception as e:
-                app.logger.error(f"All deletion attempts failed for {filepath}: {str(e)}")
+        return chain_index.sync()
+    except requests.RequestException as e:
+        app.logger.warning(f"Could not sync chain index: {str(e)}")
+        return chain_index.snapshot()
+
+def verify_transaction_proof(block_index, tx_index):
+    """
+    Check one transaction against its block header using the node's Merkle proof.
+    Returns None when the block predates Merkle headers or the node cannot be reached.
+    """
+    try:
+        resp = requests.get(f"{ADDR}/proof/{block_index}/{tx_index}")
+    except requests.RequestException as e:
+        app.logger.warning(f"Could not fetch proof for block {block_index}: {str(e)}")
+        return None
+    if resp.status_code != 200:
+        return None
+    data = resp.json()
+    return Block.verify_transaction(data["header"], data["transaction"], data["proof"], Blockchain.DIFFICULTY)
 
 # ------------------ Routes ------------------
 
@@ -195,16 +194,7 @@ def master_login():
 @login_required
 def upload():
     """Show upload page with filtered transactions."""
-    get_tx_req()
-    filtered_tx = [
-        tx for tx in request_tx
-        if 'v_file' in tx and (
-            tx.get('owner') == 'anonymous' or
-            (current_user.is_authenticated and (
-                current_user.username == tx.get('owner') or current_user.is_master
-            ))
-        )
-    ]
+    filtered_tx = get_tx_req().files_for(current_user.username, current_user.is_master)
     return render_template(
         "new_index.html",
         title="FileStorage",
@@ -213,52 +203,115 @@ def upload():
         request_tx=filtered_tx
     )
 
+def public_page_filter(sort, after):
+    """
+    Keyset filter for the page of public datasets that follows cursor `after`.
+    Uploader cursors are "<username>|<id>", or just "<id>" for a document with
+    no uploader; Mongo sorts those before every username.
+    """
+    if not after:
+        return {}
+    if sort == "newest":
+        return {"_id": {"$lt": ObjectId(after)}}
+    if "|" not in after:
+        return {"$or": [
+            {"uploader_username": None, "_id": {"$gt": ObjectId(after)}},
+            {"uploader_username": {"$ne": None}}
+        ]}
+    username, _, last_id = after.rpartition("|")
+    return {"$or": [
+        {"uploader_username": {"$gt": username}},
+        {"uploader_username": username, "_id": {"$gt": ObjectId(last_id)}}
+    ]}
+
+def public_page_cursor(sort, doc):
+    if sort == "newest" or doc.get("uploader_username") is None:
+        return str(doc["_id"])
+    return f"{doc['uploader_username']}|{doc['_id']}"
+
 @app.route('/view_public_datasets')
 def view_public_datasets():
+    """
+    One page of public datasets, sorted in Mongo (?sort=uploader|newest) and
+    paged with an ?after= cursor. Only the IDs and stored summaries are
+    fetched, never the analysis results.
+    """
+    sort = request.args.get("sort", "uploader")
+    if sort not in PUBLIC_SORTS:
+        sort = "uploader"
+    next_cursor = None
+    public_datasets = []
     try:
-        public_datasets = list(public_files.find({}))
-        for dataset in public_datasets:
-            synthetic_path = dataset.get('synthetic_file_path', '')
-            dataset['synthetic_filename'] = os.path.basename(synthetic_path)
-            if synthetic_path:
-                if os.path.isabs(synthetic_path):
-                    try:
-                        synthetic_path = os.path.relpath(synthetic_path, app.config['UPLOAD_FOLDER'])
-                    except ValueError:
-                        pass
-                synthetic_path = synthetic_path.replace("\\", "/")
-            dataset['synthetic_file_relpath'] = synthetic_path
-            dataset['uploader_username'] = dataset.get('uploader_username', 'Unknown')
-            dataset['model_filename'] = os.path.basename(dataset.get('model_name', ''))
+        docs = public_files.find(
+            public_page_filter(sort, request.args.get("after")),
+            {"dataset_id": 1, "uploader_username": 1, "summary": 1, "synthetic_file_path": 1, "model_name": 1}
+        ).sort(PUBLIC_SORTS[sort]).limit(PUBLIC_PAGE_SIZE + 1)
+        docs = list(docs)
+        if len(docs) > PUBLIC_PAGE_SIZE:
+            docs = docs[:PUBLIC_PAGE_SIZE]
+            next_cursor = public_page_cursor(sort, docs[-1])
+        for doc in docs:
+            summary = doc.get("summary") or datasets.summary(doc)
+            public_datasets.append({
+                "synthetic_filename": summary["synthetic_filename"],
+                "synthetic_file_relpath": doc.get("dataset_id") or datasets.dataset_id(doc.get("synthetic_file_path", "")),
+                "uploader_username": doc.get("uploader_username", "Unknown"),
+                "model_filename": summary["model_filename"],
+                "created": summary["created"],
+                "average_ks_stat": summary["average_ks_stat"]
+            })
     except Exception as e:
         app.logger.error(f"Failed to fetch public datasets: {e}")
         public_datasets = []
-    return render_template('view_public_datasets_with_analyze.html', public_datasets=public_datasets)
+    return render_template(
+        'view_public_datasets_with_analyze.html',
+        public_datasets=public_datasets,
+        sort=sort,
+        next_cursor=next_cursor
+    )
 
 @app.route('/analyze_dataset/<path:filename>')
 def analyze_dataset(filename):
-    """Display analysis results for a synthetic dataset file."""
+    """Display analysis results for a synthetic dataset file, with one ?page= of its rows."""
     try:
         filename = urllib.parse.unquote(filename)
-        escaped_filename = re.escape(filename)
-        doc = public_files.find_one({"synthetic_file_path": {"$regex": escaped_filename}})
+        doc = public_files.find_one(
+            {"dataset_id": datasets.dataset_id(filename)},
+            {"synthetic_file_path": 1, "analysis_results": 1}
+        )
         if not doc or "analysis_results" not in doc:
             flash('Analysis results not found for the specified dataset.', 'danger')
             return redirect(url_for('view_public_datasets'))
         analysis_results = doc["analysis_results"]
-        synthetic_csv_path = doc.get("synthetic_file_path", filename)
+        preview = analysis_results.get("preview")
         synthetic_data_html = analysis_results.get("synthetic_data_html")
-        if not synthetic_data_html:
-            import pandas as pd
-            synthetic_file_path = synthetic_csv_path
-            if not synthetic_file_path.startswith("/"):
-                synthetic_file_path = os.path.join(app.config['UPLOAD_FOLDER'], synthetic_csv_path)
-            synthetic_data = pd.read_csv(synthetic_file_path)
-            synthetic_data_html = synthetic_data.to_html(classes="table table-striped", index=False)
+        if not preview:
+            synthetic_file_path = doc.get("synthetic_file_path", filename)
+            if not os.path.isabs(synthetic_file_path):
+                synthetic_file_path = os.path.join(app.config['UPLOAD_FOLDER'], synthetic_file_path)
+            if os.path.exists(synthetic_file_path):
+                # Datasets generated before previews were stored are converted once
+                preview_path = os.path.splitext(synthetic_file_path)[0] + ".npy"
+                preview = previews.preview_from_csv(synthetic_file_path, preview_path)
+                preview["path"] = os.path.relpath(preview_path, app.config['UPLOAD_FOLDER']).replace("\\", "/")
+                public_files.update_one(
+                    {"_id": doc["_id"]},
+                    {"$set": {"analysis_results.preview": preview},
+                     "$unset": {"analysis_results.synthetic_data_html": ""}}
+                )
+                synthetic_data_html = None
+        window = None
+        if preview:
+            window = previews.read_window(
+                preview,
+                os.path.join(app.config['UPLOAD_FOLDER'], preview["path"]),
+                request.args.get("page", 1, type=int)
+            )
         return render_template(
             "analysis_results.html",
             analysis=analysis_results,
             filename=filename,
+            preview=window,
             synthetic_data_html=synthetic_data_html
         )
     except Exception as e:
@@ -270,69 +323,38 @@ def analyze_dataset(filename):
 @app.route("/generate_dataset/<filename>", methods=["POST"])
 @login_required
 def generate_dataset(filename):
-    """Generate a synthetic dataset from the uploaded file."""
-    try:
-        enc_file_path = os.path.join(
-            app.config['UPLOAD_FOLDER'],
-            f"{os.path.splitext(filename)[0]}.enc"
-        )
-        password = current_user.password if current_user.is_authenticated else "anonymous"
-        fd, decrypted_file_path = tempfile.mkstemp(suffix=".csv")
-        os.close(fd)
-        try:
-            file_encryptor.decrypt_file(enc_file_path, decrypted_file_path, password)
-            from app import gan
-            synthetic_data, analysis_results = gan.generate_synthetic_data(
-                decrypted_file_path, current_user.username, filename, output_dir=app.config['UPLOAD_FOLDER']
-            )
-            synthetic_data_html = synthetic_data.to_html(classes="table table-striped", index=False)
-            synthetic_csv_path = analysis_results.get('synthetic_csv_path')
-            if synthetic_csv_path and not os.path.isabs(synthetic_csv_path):
-                synthetic_csv_path = os.path.join(app.config['UPLOAD_FOLDER'], synthetic_csv_path)
-            app.logger.debug(f"synthetic_csv_path (full): {synthetic_csv_path}")
-            flash('Synthetic dataset generated successfully!', 'success')
-            try:
-                from app import model_mappings
-                app.logger.debug(f"Upserting document with path {synthetic_csv_path} into public_files")
-                if synthetic_csv_path:
-                    mapping = model_mappings.find_one({
-                        "username": current_user.username,
-                        "filename": filename
-                    })
-                    model_path = mapping["model_path"] if mapping and "model_path" in mapping else "CTGAN"
-                    update_doc = {
-                        "model_name": model_path,
-                        "uploader_username": current_user.username,
-                        "analysis_results": analysis_results
-                    }
-                    result = public_files.update_one(
-                        {"synthetic_file_path": synthetic_csv_path},
-                        {"$set": update_doc},
-                        upsert=True
-                    )
-                    if result.upserted_id:
-                        app.logger.info(f"Inserted new public file document with id: {result.upserted_id}")
-                    else:
-                        app.logger.info(f"Updated existing public file document with path: {synthetic_csv_path}")
-                else:
-                    app.logger.warning("Synthetic CSV path is None or empty, skipping upsert into public_files.")
-            except Exception as e:
-                app.logger.error(f"Failed to upsert public file document: {e}")
-            return render_template(
-                "analysis_results.html",
-                analysis=analysis_results,
-                filename=filename,
-                synthetic_data_html=synthetic_data_html,
-                synthetic_csv_path=synthetic_csv_path
-            )
-        finally:
-            if os.path.exists(decrypted_file_path):
-                os.remove(decrypted_file_path)
-    except Exception as e:
-        app.logger.error(f"Error generating synthetic dataset: {str(e)}")
-        app.logger.error(traceback.format_exc())
-        flash('An error occurred while generating the synthetic dataset. Please try again.', 'danger')
+    """Queue synthetic dataset generation for an uploaded file; a job worker runs it."""
+    digest = datasets.upload_digest(current_user.username, filename)
+    if not (blob_store.exists(digest) if digest else os.path.exists(datasets.legacy_upload_path(filename))):
+        flash('File not found', 'danger')
         return redirect(url_for('upload'))
+    job_id, created = job_queue.submit("generate_dataset", current_user.username, filename)
+    app.logger.info(f"{'Queued' if created else 'Reusing'} generation job {job_id} for {filename}")
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"job_id": job_id, "status": "queued" if created else "duplicate"}), 202
+    return redirect(url_for('job_page', job_id=job_id))
+
+def visible_job(job_id):
+    """The job if the current user submitted it (or is master), else 404."""
+    job = job_queue.get(job_id)
+    if job is None or (job["username"] != current_user.username and not current_user.is_master):
+        abort(404)
+    return job
+
+@app.route("/jobs/<job_id>")
+@login_required
+def job_page(job_id):
+    """Progress page for a background job; polls /job_status until it finishes."""
+    return render_template("job_status.html", job=visible_job(job_id))
+
+@app.route("/job_status/<job_id>")
+@login_required
+def job_status(job_id):
+    """Status and progress of a background job."""
+    job = visible_job(job_id)
+    return jsonify({key: job[key] for key in (
+        "id", "kind", "filename", "status", "progress", "stage", "result", "error", "created", "updated"
+    )})
 
 @app.route("/download_synthetic/<path:filepath>")
 @login_required
@@ -358,6 +380,22 @@ def download_synthetic(filepath):
         app.logger.error(f"Error serving file {filepath}: {str(e)}")
         abort(500)
 
+@app.route("/download_model/<filename>")
+@login_required
+def download_model(filename):
+    """
+    Serve a trained model as a single pickled CTGAN. Models are stored as
+    metadata plus separate generator weights, so the two are joined here.
+    """
+    from app import model_registry
+    filename = secure_filename(filename)
+    model_path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if not filename.endswith(".pkl") or not model_path or not os.path.isfile(model_path):
+        abort(404)
+    response = Response(model_registry.export_model(model_path), mimetype="application/octet-stream")
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
 @app.route("/submit", methods=["POST"])
 def submit():
     """Handle file upload and transaction submission."""
@@ -374,35 +412,46 @@ def submit():
         if file_ext not in allowed_extensions:
             flash('Invalid file type. Only .csv files are allowed.', 'danger')
             return redirect("/upload")
-        base_filename = os.path.splitext(filename)[0]
-        enc_dir = os.path.join("app/static/Uploads/")
-        if not os.path.exists(enc_dir):
-            os.makedirs(enc_dir, exist_ok=True)
-        enc_file_path = os.path.join(enc_dir, f"{base_filename}.enc")
-        up_file.save(enc_file_path)
-        file_states = os.stat(enc_file_path).st_size
         password = current_user.password if current_user.is_authenticated else "anonymous"
-        file_encryptor.encrypt_file(enc_file_path, enc_file_path, password)
-        files[up_file.filename] = enc_file_path
-        with open(files[up_file.filename], 'rb') as f:
-            file_data = base64.b64encode(f.read()).decode('utf-8')
+        # Encrypt straight from the upload stream into the blob store, which
+        # hashes the ciphertext as it is written; it lands on disk once. The
+        # plaintext is not written by this view, but Werkzeug spools uploads
+        # over 500 KB to an anonymous temporary file while parsing the form.
+        # Large uploads are split across the encryption process pool.
+        with blob_store.create() as blob:
+            if (request.content_length or 0) >= file_encryptor.PARALLEL_MIN_SIZE and file_encryptor.ENCRYPT_WORKERS > 1:
+                file_states = file_encryptor.encrypt_stream_parallel(up_file.stream, blob, password)
+            else:
+                file_states = file_encryptor.encrypt_stream(up_file.stream, blob, password)
+        file_digest, blob_size = blob.digest, blob.size
+        datasets.record_upload(user, up_file.filename, file_digest, blob_size, file_states)
         post_object = {
             "user": user,
             "v_file": up_file.filename,
-            "file_data": file_data,
+            "file_digest": file_digest,
+            "blob_size": blob_size,
             "file_size": file_states,
             "owner": current_user.username if current_user.is_authenticated else "anonymous"
         }
         address = f"{ADDR}/new_transaction"
-        requests.post(address, json=post_object)
-        mine_address = f"{ADDR}/mine"
-        try:
-            mine_response = requests.get(mine_address)
-            app.logger.info(f"Mining response: {mine_response.text}")
-        except Exception as e:
-            app.logger.error(f"Error requesting mining: {str(e)}")
+        # The node's mining scheduler seals the transaction into a block in a batch
+        tx_resp = requests.post(address, json=post_object)
+        wants_json = request.accept_mimetypes.best == "application/json"
+        if tx_resp.status_code != 201:
+            app.logger.error(f"Transaction rejected by node: {tx_resp.text}")
+            if wants_json:
+                return jsonify({"status": "rejected", "error": tx_resp.text}), 502
+            flash('The file was stored but the node rejected its transaction. Please try again.', 'danger')
+            return redirect("/upload")
+        tx_id = tx_resp.json()["tx_id"]
+        status_url = url_for('tx_status', tx_id=tx_id)
+        app.logger.info(f"Queued transaction {tx_id} for {filename}")
         end = timer()
         print(end - start)
+        if wants_json:
+            return jsonify({"tx_id": tx_id, "status": "pending", "status_url": status_url}), 201
+        flash(Markup('File uploaded. Transaction <a href="{}">{}</a> is pending and will appear once mined.')
+              .format(status_url, tx_id), 'info')
         return redirect("/upload")
     except Exception as e:
         app.logger.error(f"Error in submit: {str(e)}")
@@ -410,62 +459,191 @@ def submit():
         flash('An error occurred during file upload. Please try again.', 'danger')
         return redirect("/upload")
 
-@app.route("/submit/<string:variable>", methods=["GET"])
+@app.route("/tx_status/<tx_id>")
 @login_required
-def download_file(variable):
-    """Download and decrypt a file from the blockchain."""
-    chain_addr = f"{ADDR}/chain"
-    resp = requests.get(chain_addr)
-    if resp.status_code == 200:
-        chain = json.loads(resp.content.decode())
-        for block in chain["chain"]:
-            for trans in block["transactions"]:
-                if trans.get("v_file") == variable:
-                    if (
-                        (current_user.is_authenticated and (
-                            current_user.username == trans.get("owner") or current_user.is_master
-                        )) or trans.get("owner") == "anonymous"
-                    ):
-                        base_filename = os.path.splitext(variable)[0]
-                        temp_path = os.path.join(
-                            app.root_path, "static", "Uploads", f"temp_{base_filename}.csv"
-                        )
-                        password = current_user.password if current_user.is_authenticated else "anonymous"
-                        file_encryptor.decrypt_file(files[variable], temp_path, password)
-                        try:
-                            response = send_file(temp_path, as_attachment=True)
-                            response.call_on_close(lambda: delete_temp_file(temp_path))
-                            return response
-                        except Exception:
-                            delete_temp_file(temp_path)
-                            raise
-                    else:
-                        flash('You do not have permission to access this file', 'danger')
-                        return redirect(url_for('index'))
+def tx_status(tx_id):
+    """Poll the node for the mining status of an uploaded file's transaction."""
+    try:
+        resp = requests.get(f"{ADDR}/tx/{tx_id}")
+    except requests.RequestException as e:
+        app.logger.warning(f"Could not reach node for transaction {tx_id}: {str(e)}")
+        return jsonify({"tx_id": tx_id, "status": "unknown"}), 503
+    if resp.status_code != 200:
+        return jsonify({"tx_id": tx_id, "status": "unknown"}), 404
+    return jsonify(resp.json())
+
+@app.route("/admin/key_cache")
+@login_required
+def key_cache_stats():
+    """Hit and miss counters of the derived-key cache (master users only)."""
+    if not current_user.is_master:
+        abort(403)
+    return jsonify(key_cache.default_cache.stats())
+
+def find_accessible_file(variable):
+    """
+    Chain entries for `variable` (narrowed by ?block=) and the first of them the
+    current user may read, or None.
+    """
+    matches = get_tx_req().find_file(variable)
+    # ?block= picks a specific upload when the same filename was stored more than once
+    block_index = request.args.get("block", type=int)
+    if block_index is not None:
+        matches = [trans for trans in matches if trans["index"] == block_index]
+    for trans in matches:
+        if (
+            (current_user.is_authenticated and (
+                current_user.username == trans.get("owner") or current_user.is_master
+            )) or trans.get("owner") == "anonymous"
+        ):
+            return matches, trans
+    return matches, None
+
+def open_encrypted(trans, variable):
+    """
+    Seekable handle on an encrypted upload. Blobs are opened without the
+    whole-file digest check; ChunkedReader authenticates each chunk it reads.
+    Uploads from before the blob store are read from the upload folder.
+    """
+    if "file_digest" in trans:
+        return blob_store.open(trans["file_digest"], verify=False)
+    return open(datasets.legacy_upload_path(variable), 'rb')
+
+def file_password(trans):
+    """The password an upload was encrypted with: its owner's, or "anonymous"."""
+    if trans.get("owner") == "anonymous" or not current_user.is_authenticated:
+        return "anonymous"
+    return current_user.password
+
+def open_chunked(trans, variable, password):
+    """
+    A ChunkedReader on the upload, or None if it predates the chunked format.
+    Raises IntegrityError if the file is truncated or the key is wrong.
+    """
+    infile = open_encrypted(trans, variable)
+    try:
+        return file_encryptor.ChunkedReader(infile, password)
+    except file_encryptor.NotChunkedError:
+        infile.close()
+        return None
+    except file_encryptor.IntegrityError:
+        infile.close()
+        raise
+
+def decryption_failed(trans, variable, error):
+    """
+    Abort for an upload that failed authentication: 403 when the current user
+    is not the owner (their key cannot decrypt it), 500 otherwise.
+    """
+    app.logger.error(f"Could not decrypt {variable}: {str(error)}")
+    if trans.get("owner") not in ("anonymous", current_user.username):
+        abort(403)
+    abort(500)
+
+def range_response(reader):
+    """206 response for the request's Range header, decrypting only the chunks it covers."""
+    byte_range = request.range.range_for_length(reader.size)
+    if byte_range is None:
+        response = Response(status=416)
+        response.headers["Content-Range"] = f"bytes */{reader.size}"
+        return response
+    start, end = byte_range
+    response = Response(reader.iter_range(start, end), status=206, mimetype="text/csv")
+    response.headers["Content-Range"] = f"bytes {start}-{end - 1}/{reader.size}"
+    response.headers["Content-Length"] = str(end - start)
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
+def file_access_denied(matches):
+    if matches:
+        flash('You do not have permission to access this file', 'danger')
+        return redirect(url_for('index'))
     flash('File not found', 'danger')
     return redirect(url_for('index'))
 
+@app.route("/submit/<string:variable>", methods=["GET"])
+@login_required
+def download_file(variable):
+    """
+    Download and decrypt a file from the blockchain. Honors single HTTP Range
+    requests. The final chunk and the first chunk sent are authenticated before
+    the response starts, so a truncated file or a wrong key gets an error
+    status instead of a cut-off body.
+    """
+    matches, trans = find_accessible_file(variable)
+    if trans is None:
+        return file_access_denied(matches)
+    password = file_password(trans)
+    reader = None
+    try:
+        reader = open_chunked(trans, variable, password)
+        if reader is None:
+            # Files from before the chunked format can only be decrypted whole
+            with open_encrypted(trans, variable) as infile:
+                response = Response(file_encryptor.decrypt_bytes(infile.read(), password), mimetype="text/csv")
+        # Multi-range requests are answered with the whole file
+        elif request.range is not None and len(request.range.ranges) == 1:
+            response = range_response(reader)
+        else:
+            # Decrypted chunk by chunk into the response; nothing is written to disk
+            response = Response(reader.iter_range(), mimetype="text/csv")
+            response.headers["Content-Length"] = str(reader.size)
+            response.headers["Accept-Ranges"] = "bytes"
+    except file_encryptor.IntegrityError as e:
+        if reader is not None:
+            reader.close()
+        decryption_failed(trans, variable, e)
+    if reader is not None:
+        response.call_on_close(reader.close)
+    download_name = secure_filename(f"{os.path.splitext(variable)[0]}.csv")
+    response.headers["Content-Disposition"] = f"attachment; filename={download_name}"
+    return response
+
+@app.route("/preview/<string:variable>")
+@login_required
+def preview_file(variable):
+    """The header and first ?rows= rows of a stored CSV, decrypting only the chunks they span."""
+    matches, trans = find_accessible_file(variable)
+    if trans is None:
+        return file_access_denied(matches)
+    rows = max(0, min(request.args.get("rows", PREVIEW_ROWS, type=int), MAX_PREVIEW_ROWS))
+    try:
+        reader = open_chunked(trans, variable, file_password(trans))
+    except file_encryptor.IntegrityError as e:
+        decryption_failed(trans, variable, e)
+    if reader is None:
+        flash('Preview is not available for this file', 'warning')
+        return redirect(url_for('index'))
+    preview = bytearray()
+    with reader:
+        try:
+            for chunk in reader.iter_range():
+                preview += chunk
+                if preview.count(b"\n") > rows:
+                    break
+        except file_encryptor.IntegrityError as e:
+            decryption_failed(trans, variable, e)
+    lines = bytes(preview).split(b"\n")[:rows + 1]
+    return Response(b"\n".join(lines) + b"\n", mimetype="text/plain")
+
 @app.route('/view_block/<int:block_index>/<filename>')
 @login_required
 def view_block(block_index, filename):
     """Display block contents for authenticated user."""
-    chain_addr = f"{ADDR}/chain"
-    resp = requests.get(chain_addr)
-    if resp.status_code == 200:
-        chain = json.loads(resp.content.decode())
-        for block in chain["chain"]:
-            if block["index"] == block_index:
-                for trans in block["transactions"]:
-                    if (
-                        trans.get("v_file") == filename and (
-                            current_user.username == trans.get("owner") or current_user.is_master
-                        )
-                    ):
-                        return render_template(
-                            "new_view_block.html",
-                            block=block,
-                            transaction=trans,
-                            filename=filename
-                        )
-        flash('Block or file not found', 'danger')
+    block = fetch_block(block_index)
+    if block:
+        for tx_index, trans in enumerate(block["transactions"]):
+            if (
+                trans.get("v_file") == filename and (
+                    current_user.username == trans.get("owner") or current_user.is_master
+                )
+            ):
+                return render_template(
+                    "new_view_block.html",
+                    block=block,
+                    transaction=trans,
+                    filename=filename,
+                    verified=verify_transaction_proof(block_index, tx_index)
+                )
+    flash('Block or file not found', 'danger')
     return redirect(url_for('index'))
@@ -0,0 +1,145 @@
+import logging
+
+import numpy as np
+import torch
+from torch import optim
+
+from ctgan import CTGAN
+from ctgan.data_sampler import DataSampler
+from ctgan.data_transformer import DataTransformer
+from ctgan.synthesizers.ctgan import Discriminator, Generator
+
+# Epochs used when continuing from a model trained on data with the same schema
+WARM_START_EPOCHS = 30
+
+class WarmStartCTGAN(CTGAN):
+    """
+    CTGAN whose fit() can continue from an earlier model and stops once the
+    losses have converged.
+
+    With init_from, the earlier model's DataTransformer is reused to encode the
+    new data and its generator weights are the starting point, so a dataset
+    that only changed a little needs a fraction of the epochs. If the new data
+    cannot be encoded that way (new categories, different layout) training
+    falls back to a cold start. The discriminator always starts fresh.
+
+    Early stopping compares the mean generator and discriminator losses of the
+    last `patience` epochs with the `patience` epochs before them, and stops
+    once both moved by less than `tolerance` (relative) after `min_epochs`.
+    """
+
+    def __init__(self, patience=10, tolerance=0.01, min_epochs=20, **kwargs):
+        super().__init__(**kwargs)
+        self.patience = patience
+        self.tolerance = tolerance
+        self.min_epochs = min_epochs
+        self.epochs_trained = 0
+
+    def _encode(self, train_data, discrete_columns, init_from):
+        if init_from is not None:
+            try:
+                encoded = init_from._transformer.transform(train_data)
+                if encoded.shape[1] == init_from._transformer.output_dimensions:
+                    self._transformer = init_from._transformer
+                    return encoded, True
+            except Exception as e:
+                logging.info(f"Cannot reuse the previous model's encoding, training from scratch: {str(e)}")
+        self._transformer = DataTransformer()
+        self._transformer.fit(train_data, discrete_columns)
+        return self._transformer.transform(train_data), False
+
+    def _converged(self, losses):
+        if len(losses) < max(self.min_epochs, 2 * self.patience):
+            return False
+        recent = np.mean(losses[-self.patience:], axis=0)
+        before = np.mean(losses[-2 * self.patience:-self.patience], axis=0)
+        change = np.abs(recent - before) / np.maximum(np.abs(before), 1.0)
+        return bool(np.all(change < self.tolerance))
+
+    def _sample_condvec(self):
+        condvec = self._data_sampler.sample_condvec(self._batch_size)
+        if condvec is None:
+            return None, None, None, None
+        c1, m1, col, opt = condvec
+        return torch.from_numpy(c1).to(self._device), torch.from_numpy(m1).to(self._device), col, opt
+
+    def fit(self, train_data, discrete_columns=(), epochs=None, init_from=None, progress=None,
+            warm_epochs=WARM_START_EPOCHS):
+        """
+        Train on `train_data`, starting from `init_from` when given. A warm
+        start runs for up to `warm_epochs` epochs; a cold one, including a warm
+        start that fell back, for up to `epochs` (the constructor's by default).
+        progress(epoch, epochs) is called after each epoch.
+        """
+        self._validate_discrete_columns(train_data, discrete_columns)
+        train_data, warm = self._encode(train_data, discrete_columns, init_from)
+        epochs = (warm_epochs if warm else epochs) or self._epochs
+        self._data_sampler = DataSampler(train_data, self._transformer.output_info_list, self._log_frequency)
+        data_dim = self._transformer.output_dimensions
+        cond_dim = self._data_sampler.dim_cond_vec()
+
+        self._generator = Generator(self._embedding_dim + cond_dim, self._generator_dim, data_dim).to(self._device)
+        if warm:
+            self._generator.load_state_dict(init_from._generator.state_dict())
+        discriminator = Discriminator(data_dim + cond_dim, self._discriminator_dim, pac=self.pac).to(self._device)
+        optimizer_g = optim.Adam(self._generator.parameters(), lr=self._generator_lr,
+                                 betas=(0.5, 0.9), weight_decay=self._generator_decay)
+        optimizer_d = optim.Adam(discriminator.parameters(), lr=self._discriminator_lr,
+                                 betas=(0.5, 0.9), weight_decay=self._discriminator_decay)
+
+        mean = torch.zeros(self._batch_size, self._embedding_dim, device=self._device)
+        std = mean + 1
+        steps_per_epoch = max(len(train_data) // self._batch_size, 1)
+        losses = []
+        for epoch in range(epochs):
+            for _ in range(steps_per_epoch):
+                for _ in range(self._discriminator_steps):
+                    fakez = torch.normal(mean=mean, std=std)
+                    c1, m1, col, opt = self._sample_condvec()
+                    if c1 is None:
+                        real = self._data_sampler.sample_data(train_data, self._batch_size, None, None)
+                    else:
+                        fakez = torch.cat([fakez, c1], dim=1)
+                        perm = np.random.permutation(self._batch_size)
+                        real = self._data_sampler.sample_data(train_data, self._batch_size, col[perm], opt[perm])
+                        c2 = c1[perm]
+                    fakeact = self._apply_activate(self._generator(fakez))
+                    real = torch.from_numpy(real.astype('float32')).to(self._device)
+                    if c1 is not None:
+                        fakeact = torch.cat([fakeact, c1], dim=1)
+                        real = torch.cat([real, c2], dim=1)
+                    y_fake = discriminator(fakeact)
+                    y_real = discriminator(real)
+                    pen = discriminator.calc_gradient_penalty(real, fakeact, self._device, self.pac)
+                    loss_d = -(torch.mean(y_real) - torch.mean(y_fake))
+                    optimizer_d.zero_grad(set_to_none=False)
+                    pen.backward(retain_graph=True)
+                    loss_d.backward()
+                    optimizer_d.step()
+
+                fakez = torch.normal(mean=mean, std=std)
+                c1, m1, _, _ = self._sample_condvec()
+                if c1 is not None:
+                    fakez = torch.cat([fakez, c1], dim=1)
+                fake = self._generator(fakez)
+                fakeact = self._apply_activate(fake)
+                if c1 is None:
+                    y_fake = discriminator(fakeact)
+                    cross_entropy = 0
+                else:
+                    y_fake = discriminator(torch.cat([fakeact, c1], dim=1))
+                    cross_entropy = self._cond_loss(fake, c1, m1)
+                loss_g = -torch.mean(y_fake) + cross_entropy
+                optimizer_g.zero_grad(set_to_none=False)
+                loss_g.backward()
+                optimizer_g.step()
+
+            losses.append((loss_g.detach().cpu().item(), loss_d.detach().cpu().item()))
+            if self._verbose:
+                print(f"Epoch {epoch + 1}, Loss G: {losses[-1][0]:.4f}, Loss D: {losses[-1][1]:.4f}")
+            if progress is not None:
+                progress(epoch + 1, epochs)
+            if self._converged(losses):
+                logging.info(f"Losses converged after {epoch + 1} of {epochs} epochs")
+                break
+        self.epochs_trained = len(losses)
@@ -2,6 +2,8 @@ import json
 import requests
 import getpass
 from config import Config
+from Block import Block
+from Blockchain import Blockchain
 
 ADDR = "http://127.0.0.1:8800"
 
@@ -16,16 +18,23 @@ def user_login(username: str, password: str) -> bool:
 
 def get_block(block_index: int) -> dict | None:
     """Retrieve specific block by index."""
-    chain_url = f"{ADDR}/chain"
-    response = requests.get(chain_url)
+    response = requests.get(f"{ADDR}/blocks/{block_index}")
     if response.status_code != 200:
         return None
+    return response.json()
 
-    chain = response.json()
-    for block in chain.get("chain", []):
-        if block.get("index") == block_index:
-            return block
-    return None
+def verify_transaction(block_index: int, tx_index: int) -> bool | None:
+    """Verify one transaction against its block header via the node's Merkle proof."""
+    response = requests.get(f"{ADDR}/proof/{block_index}/{tx_index}")
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    return Block.verify_transaction(data["header"], data["transaction"], data["proof"], Blockchain.DIFFICULTY)
+
+def describe_proof(result: bool | None) -> str:
+    if result is None:
+        return "not available"
+    return "verified" if result else "FAILED"
 
 def print_file_from_block(block_index: int, filename: str, username: str) -> None:
     """Print file contents from specific block."""
@@ -39,12 +48,16 @@ def print_file_from_block(block_index: int, filename: str, username: str) -> Non
         print(f"Block {block_index} not found")
         return
 
-    for transaction in block.get("transactions", []):
+    for tx_index, transaction in enumerate(block.get("transactions", [])):
         if (transaction.get("v_file") == filename and 
             transaction.get("owner") == username):
             print(f"\nFile: {filename}")
             print(f"Owner: {transaction.get('owner')}")
             print(f"Size: {transaction.get('file_size')} bytes")
+            print(f"Inclusion proof: {describe_proof(verify_transaction(block_index, tx_index))}")
+            if transaction.get("file_digest"):
+                print(f"Blob: {transaction['file_digest']} ({transaction.get('blob_size')} bytes)")
+                return
             print("\nContents:")
             print(transaction.get("file_data"))
             return
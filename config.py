@@ -10,3 +10,10 @@ class Config:
     SESSION_COOKIE_SECURE = True
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
+    # Content-addressed store for encrypted uploads (kept outside app/static)
+    BLOB_STORE_DIR = os.getenv('BLOB_STORE_DIR', 'blobstore')
+    # Background jobs (synthetic dataset generation): queue database and worker processes
+    JOB_DB_PATH = os.getenv('JOB_DB_PATH', 'jobs.db')
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+    # Import torch and the rest of the ML stack when a job worker starts instead of on its first job
+    JOB_PRELOAD = os.getenv('JOB_PRELOAD', '0') == '1'
@@ -0,0 +1,57 @@
+import json
+from hashlib import sha256
+
+# Prefixes keep leaf and interior hashes apart so a node can never pass as a leaf
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+def serialize_transaction(transaction):
+    """Canonical byte form of a transaction, stable across JSON round trips."""
+    return json.dumps(transaction, sort_keys=True, separators=(",", ":")).encode()
+
+def leaf_hash(transaction):
+    return sha256(LEAF_PREFIX + serialize_transaction(transaction)).digest()
+
+def node_hash(left, right):
+    return sha256(NODE_PREFIX + left + right).digest()
+
+def _next_level(level):
+    if len(level) % 2:
+        level = level + [level[-1]]
+    return [node_hash(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+
+def merkle_root(transactions):
+    """
+    Returns the hex Merkle root of a list of transactions.
+    An empty list has the root sha256(b"").
+    """
+    level = [leaf_hash(t) for t in transactions]
+    if not level:
+        return sha256(b"").hexdigest()
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0].hex()
+
+def merkle_proof(transactions, position):
+    """
+    Returns the inclusion proof for transactions[position] as a list of
+    [sibling_hex, side] pairs from leaf to root, where side is "L" or "R".
+    """
+    level = [leaf_hash(t) for t in transactions]
+    proof = []
+    while len(level) > 1:
+        if len(level) % 2:
+            level = level + [level[-1]]
+        sibling = position ^ 1
+        proof.append([level[sibling].hex(), "L" if sibling < position else "R"])
+        level = _next_level(level)
+        position //= 2
+    return proof
+
+def verify_proof(transaction, proof, root):
+    """Checks that `transaction` is included under the hex Merkle `root`."""
+    current = leaf_hash(transaction)
+    for sibling_hex, side in proof:
+        sibling = bytes.fromhex(sibling_hex)
+        current = node_hash(sibling, current) if side == "L" else node_hash(current, sibling)
+    return current.hex() == root
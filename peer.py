@@ -1,37 +1,176 @@
+import os
 import json
-from flask import Flask, request
+import atexit
+import threading
+from itertools import islice
+from flask import Flask, Response, request
 from Blockchain import Blockchain
 from Block import Block
+from BlockStore import BlockStore
+from MiningScheduler import MiningScheduler
 
 app = Flask(__name__)
-blockchain = Blockchain()
+# Set by start_node; importing this module (as spawned mining workers do) must
+# not open the chain store
+blockchain = None
+scheduler = None
 peers = []
+_start_lock = threading.Lock()
+
+# Most blocks returned by one /blocks or /headers call
+MAX_PAGE = 100
+
+def start_node(data_dir=None):
+    """
+    Open the chain store (CHAIN_DATA_DIR by default), recover it and start the
+    mining scheduler, once per process. Returns the Blockchain.
+    """
+    global blockchain, scheduler
+    with _start_lock:
+        if blockchain is None:
+            store = BlockStore(data_dir or os.getenv("CHAIN_DATA_DIR", "chaindata"))
+            # Flush the last partial fsync batch on a clean shutdown
+            atexit.register(store.close)
+            chain = Blockchain(store)
+            scheduler = MiningScheduler(chain).start()
+            blockchain = chain
+    return blockchain
+
+@app.before_request
+def ensure_node():
+    # Started on the first request too, so the node also mines when served by
+    # `flask run` or a WSGI server rather than `python peer.py`
+    start_node()
 
 @app.route("/new_transaction", methods=["POST"])
 def new_transaction():
     """
     Add a new transaction to the list of pending transactions.
+    Returns the transaction id to poll at /tx/<tx_id>; the mining scheduler
+    seals it into a block.
     """
     file_data = request.get_json()
-    required_fields = ["user", "v_file", "file_data", "file_size"]
+    required_fields = ["user", "v_file", "file_size"]
     if not all(field in file_data and file_data[field] for field in required_fields):
         return "Transaction does not have valid fields!", 404
-    blockchain.add_pending(file_data)
-    return "Success", 201
+    # Payload is either inline (legacy) or a digest into the uploader's blob store
+    if not (file_data.get("file_data") or file_data.get("file_digest")):
+        return "Transaction does not have valid fields!", 404
+    tx_id = blockchain.add_pending(file_data)
+    scheduler.notify()
+    return json.dumps({"tx_id": tx_id, "status": "pending"}), 201
+
+@app.route("/tx/<tx_id>", methods=["GET"])
+def get_transaction_status(tx_id):
+    """
+    Return whether a transaction is still pending or which block holds it.
+    """
+    status = blockchain.transaction_status(tx_id)
+    if status is None:
+        return "Transaction not found.", 404
+    return json.dumps(dict(status, tx_id=tx_id))
+
+def _stream_chain(length):
+    """Yield the {"length", "chain"} document one block at a time."""
+    yield f'{{"length": {length}, "chain": ['
+    for i, block in enumerate(islice(blockchain.chain, length)):
+        yield (", " if i else "") + json.dumps(block.to_dict())
+    yield "]}"
+
+def _stream_chain_ndjson(length):
+    """Yield one JSON block per line."""
+    for block in islice(blockchain.chain, length):
+        yield json.dumps(block.to_dict()) + "\n"
 
 @app.route("/chain", methods=["GET"])
 def get_chain():
     """
-    Return the full blockchain.
+    Return the full blockchain, streamed block by block so memory use is bounded
+    by the largest block. ?format=ndjson returns one block per line instead.
+    """
+    length = len(blockchain.chain)
+    print(f"Chain Len: {length}")
+    if request.args.get("format") == "ndjson":
+        return Response(_stream_chain_ndjson(length), mimetype="application/x-ndjson")
+    return Response(_stream_chain(length), mimetype="application/json")
+
+def _int_arg(name, default):
+    try:
+        return int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        return None
+
+def _page(start, stop, headers_only):
+    """
+    Serialize blocks [start, stop) of the chain, at most MAX_PAGE of them.
+    `next` is the index to request for the following page, or None at the end.
+    """
+    length = len(blockchain.chain)
+    start = max(start, 0)
+    stop = min(stop, length, start + MAX_PAGE)
+    blocks = [blockchain.chain[i] for i in range(start, stop)]
+    return json.dumps({
+        "length": length,
+        "blocks": [b.to_header_dict() if headers_only else b.to_dict() for b in blocks],
+        "next": stop if stop < length else None
+    })
+
+@app.route("/blocks/<int:block_index>", methods=["GET"])
+def get_block(block_index):
+    """
+    Return a single block, or only its header with ?headers_only=1.
+    """
+    if not 0 <= block_index < len(blockchain.chain):
+        return "Block not found.", 404
+    block = blockchain.chain[block_index]
+    if request.args.get("headers_only") in ("1", "true"):
+        return json.dumps(block.to_header_dict())
+    return json.dumps(block.to_dict())
+
+@app.route("/blocks", methods=["GET"])
+def get_blocks():
+    """
+    Return blocks with index in [from, to), capped by ?limit= and MAX_PAGE.
+    """
+    start = _int_arg("from", 0)
+    stop = _int_arg("to", len(blockchain.chain))
+    limit = _int_arg("limit", MAX_PAGE)
+    if start is None or stop is None or limit is None:
+        return "Invalid range.", 400
+    headers_only = request.args.get("headers_only") in ("1", "true")
+    return _page(start, min(stop, start + max(limit, 0)), headers_only)
+
+@app.route("/headers", methods=["GET"])
+def get_headers():
+    """
+    Return block headers starting at ?from=, capped by ?limit= and MAX_PAGE.
+    """
+    start = _int_arg("from", 0)
+    limit = _int_arg("limit", MAX_PAGE)
+    if start is None or limit is None:
+        return "Invalid range.", 400
+    return _page(start, start + max(limit, 0), True)
+
+@app.route("/proof/<int:block_index>/<int:tx_index>", methods=["GET"])
+def get_transaction_proof(block_index, tx_index):
+    """
+    Return one transaction, its Merkle inclusion proof and the block header.
     """
-    chain = [block.__dict__ for block in blockchain.chain]
-    print(f"Chain Len: {len(chain)}")
-    return json.dumps({"length": len(chain), "chain": chain})
+    if not 0 <= block_index < len(blockchain.chain):
+        return "Block not found.", 404
+    block = blockchain.chain[block_index]
+    if block.version < Block.MERKLE_VERSION or not 0 <= tx_index < len(block.transactions):
+        return "Transaction not found.", 404
+    return json.dumps({
+        "header": block.to_header_dict(),
+        "transaction": block.transactions[tx_index],
+        "proof": block.transaction_proof(tx_index)
+    })
 
 @app.route("/mine", methods=["GET"])
 def mine_unconfirmed_transactions():
     """
-    Mine pending transactions.
+    Mine pending transactions now, without waiting for the scheduler.
     """
     result = blockchain.mine()
     if result:
@@ -52,11 +191,7 @@ def validate_and_add_block():
     """
     block_data = request.get_json()
     try:
-        block = Block(
-            block_data["index"],
-            block_data["transactions"],
-            block_data["prev_hash"]
-        )
+        block = Block.from_dict(block_data)
         hashl = block_data["hash"]
     except KeyError:
         return "Invalid block data.", 400
@@ -67,4 +202,8 @@ def validate_and_add_block():
     return "The block was added to the chain.", 201
 
 if __name__ == "__main__":
+    # With the reloader the parent process only watches files; the serving
+    # child (WERKZEUG_RUN_MAIN) owns the store
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_node()
     app.run(port=8800, debug=True)
@@ -1,6 +1,6 @@
 import sys
 import os
-from app import app
+from app import app, jobs, datasets
 
 def main():
     # Ensure the current directory is in the Python path
@@ -8,6 +8,13 @@ def main():
     if current_dir not in sys.path:
         sys.path.append(current_dir)
 
+    # The reloader runs main() in a watcher and a serving process; only the
+    # serving one checks the Mongo indexes and starts job workers.
+    # JOB_WORKERS=0 leaves the workers to `python -m app.jobs`.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        datasets.check_indexes()
+        jobs.start_workers()
+
     app.run(host='localhost', port=9000, debug=True)
 
 if __name__ == "__main__":